@@ -1,9 +1,19 @@
 import bpy
+from bpy.app.handlers import persistent
 from bpy.props import BoolProperty, FloatProperty
-from decimal import Decimal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-import bmesh
+import cProfile
+import functools
+import io
 import numpy as np
+import pstats
+import re
+import time
+
+from . import core
 
 bl_info = {
     "name": "NekoTools🐾",
@@ -16,21 +26,413 @@ bl_info = {
 }
 
 
+# 性能记录：场景属性 profile_operators 打开后，每次 execute 的总用时、各阶段用时和计数记到 profile_log
+profile_log = deque(maxlen=50)
+profile_records = []
+
+
+def profiling_enabled(context=None) -> bool:
+    scene = (context or bpy.context).scene
+    return scene is not None and getattr(scene, "profile_operators", False)
+
+
+@contextmanager
+def profiling(name: str):
+    # 记录 with 块的总用时，块内的 phase() / profile_count() 记到这条记录里
+    record = {"operator": name, "phases": {}, "counters": {}}
+    profile_records.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        profile_records.pop()
+        profile_log.append(record)
+
+
+def instrumented(execute):
+    @functools.wraps(execute)
+    def wrapper(self, context):
+        with weight_cache_scope():
+            return profiled_execute(execute, self, context)
+    return wrapper
+
+
+def profiled_execute(execute, self, context):
+    if not profiling_enabled(context):
+        return execute(self, context)
+
+    profiler = cProfile.Profile() if context.scene.profile_cprofile else None
+    with profiling(self.bl_idname) as record:
+        if profiler is None:
+            result = execute(self, context)
+        else:
+            result = profiler.runcall(execute, self, context)
+
+    record["result"] = ", ".join(sorted(result))
+    if profiler is not None:
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(20)
+        record["profile"] = stream.getvalue()
+        print(record["profile"])
+    return result
+
+
+@contextmanager
+def phase(name: str):
+    # 没有正在记录的算子时什么也不做
+    if not profile_records:
+        yield
+        return
+    phases = profile_records[-1]["phases"]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def profile_count(name: str, amount: int = 1):
+    if profile_records:
+        counters = profile_records[-1]["counters"]
+        counters[name] = counters.get(name, 0) + amount
+
+
 def switch_mode(mode):
     if bpy.ops.object.mode_set.poll():
-        bpy.ops.object.mode_set(mode=mode, toggle=False)
+        profile_count("mode switch")
+        with phase("mode switch"):
+            bpy.ops.object.mode_set(mode=mode, toggle=False)
+
+
+@contextmanager
+def mode_session(obj, mode: str):
+    # 整个 with 块只切换一次模式，结束后恢复原模式；已经在该模式时不切换
+    init_mode = obj.mode
+    if init_mode != mode:
+        switch_mode(mode)
+    try:
+        yield
+    finally:
+        if init_mode != mode:
+            switch_mode(init_mode)
+
+
+def hidden_by_collections(bones) -> np.ndarray:
+    # bones 或 edit_bones 里因为所属的骨骼集合全部隐藏而看不到的骨骼，不在任何集合里的骨骼总是可见
+    # 所有集合都可见时不用逐个检查
+    armature = bones.id_data
+    collections = getattr(armature, "collections_all", armature.collections)
+    hidden = {collection.name for collection in collections
+              if not getattr(collection, "is_visible_effectively", collection.is_visible)}
+    if not hidden:
+        return np.zeros(len(bones), dtype=bool)
+    return np.array([len(bone.collections) > 0 and all(c.name in hidden for c in bone.collections)
+                     for bone in bones], dtype=bool)
+
+
+class BoneData:
+    # 从 armature.data.bones 整体读出的只读骨骼数据（骨架空间），分析时不需要进入编辑模式
+    # 骨架正在编辑时先 update_from_editmode，把编辑骨骼同步到 bones
+    def __init__(self, armature: bpy.types.Object):
+        if armature.mode == "EDIT":
+            armature.update_from_editmode()
+        bones = armature.data.bones
+        count = len(bones)
+        self.names = bones.keys()
+        self.lookup = {name: i for i, name in enumerate(self.names)}
+
+        self.heads = np.empty(count * 3, dtype=np.float32)
+        self.tails = np.empty(count * 3, dtype=np.float32)
+        bones.foreach_get("head_local", self.heads)
+        bones.foreach_get("tail_local", self.tails)
+        self.heads = self.heads.reshape(-1, 3)
+        self.tails = self.tails.reshape(-1, 3)
+
+        self.read_selection(bones)
+
+        # 指针类属性没有 foreach_get，只能逐个读
+        self.parent = np.array([-1 if bone.parent is None else self.lookup[bone.parent.name] for bone in bones],
+                               dtype=np.int32)
+        self.in_collection = np.array([len(bone.collections) > 0 for bone in bones], dtype=bool)
+        self.colored = np.array([bone.color.palette != "DEFAULT" for bone in bones], dtype=bool)
+
+    def __len__(self):
+        return len(self.names)
+
+    def same_rest(self, bones) -> bool:
+        # 只用 foreach_get 读 head_local / tail_local 比较；脚本直接改了骨骼位置而没有 depsgraph 更新时也能发现
+        heads = np.empty(len(bones) * 3, dtype=np.float32)
+        tails = np.empty(len(bones) * 3, dtype=np.float32)
+        bones.foreach_get("head_local", heads)
+        bones.foreach_get("tail_local", tails)
+        return np.array_equal(heads, self.heads.reshape(-1)) and np.array_equal(tails, self.tails.reshape(-1))
+
+    def read_selection(self, bones):
+        self.select = np.zeros(len(bones), dtype=bool)
+        self.hide = np.zeros(len(bones), dtype=bool)
+        bones.foreach_get("select", self.select)
+        bones.foreach_get("hide", self.hide)
+        self.hide |= hidden_by_collections(bones)
+
+    def selected(self) -> np.ndarray:
+        # 与 context.selected_bones 一致，不包括隐藏的骨骼和隐藏的骨骼集合里的骨骼
+        return np.flatnonzero(self.select & ~self.hide)
+
+    def indices(self, names) -> np.ndarray:
+        return np.sort(np.array([self.lookup[name] for name in names], dtype=np.int64))
+
+
+# 骨架和网格的派生数据：骨骼数组、骨骼链索引、绑定的网格、顶点权重
+# 键里带 datablock 指针；depsgraph 报告更新时失效，撤销和打开文件时清空，超过内存预算时淘汰最久没用的
+# 顶点权重只在一次 execute 内缓存，见 weight_cache_scope
+analysis_cache = core.cache.LRUCache(budget=128 * 1024 * 1024)
+
+
+class ArmatureAnalysis:
+    # depsgraph 报告骨架更新或插件自己改了骨骼后只标记 dirty，下次使用时重新读骨骼数组；名字和父级没变时骨骼链索引继续有效
+    # 没有标记时也会比较骨骼名字和静止位置，-b 下连续调用 bpy.ops 之间没有 depsgraph 更新
+    # 选择和隐藏状态每次使用都重新读
+    def __init__(self, key, armature: bpy.types.Object):
+        self.key = key
+        self.bones = BoneData(armature)
+        self.chains = None
+        self.meshes = None
+        self.dirty = False
+
+    def refresh(self, armature: bpy.types.Object):
+        if armature.mode == "EDIT":
+            armature.update_from_editmode()
+        bones = armature.data.bones
+        if not self.dirty and bones.keys() == self.bones.names and self.bones.same_rest(bones):
+            self.bones.read_selection(bones)
+            return
+        data = BoneData(armature)
+        if data.names != self.bones.names or not np.array_equal(data.parent, self.bones.parent):
+            self.chains = None
+        self.bones = data
+        self.dirty = False
+        analysis_cache.put(self.key, self)
+
+    def chain_index(self) -> "core.chains.BoneChainIndex":
+        if self.chains is None:
+            self.chains = core.chains.BoneChainIndex(self.bones.names, self.bones.parent)
+            analysis_cache.put(self.key, self)
+        return self.chains
+
+    def bound_meshes(self, armature: bpy.types.Object, objects=None) -> list:
+        # objects 需要能按名字 get，默认为当前场景的物体
+        if objects is None:
+            objects = bpy.context.scene.objects
+        if self.meshes is not None:
+            meshes = [objects.get(name) for name in self.meshes]
+            if all(meshes):
+                return meshes
+        meshes = find_armature_meshes(armature, objects)
+        self.meshes = [mesh.name for mesh in meshes]
+        return meshes
+
+
+def armature_analysis(armature: bpy.types.Object) -> ArmatureAnalysis:
+    key = ("armature", armature.as_pointer(), armature.data.as_pointer())
+    analysis = analysis_cache.get(key)
+    if analysis is None:
+        profile_count("analysis cache miss")
+        return analysis_cache.put(key, ArmatureAnalysis(key, armature))
+    profile_count("analysis cache hit")
+    analysis.refresh(armature)
+    return analysis
+
+
+def invalidate_armature_analysis(armature):
+    # 修改了骨骼的操作调用，不用等 depsgraph 更新；armature 可以是骨架物体或骨架数据
+    data = armature.data if isinstance(armature, bpy.types.Object) else armature
+    pointer = data.as_pointer()
+    for key in analysis_cache.keys():
+        if key[0] == "armature" and key[2] == pointer:
+            analysis_cache.entries[key].dirty = True
+
+
+def vertex_weights_key(mesh) -> tuple:
+    return ("weights", mesh.as_pointer(), mesh.data.as_pointer())
+
+
+def scan_vertex_weights(mesh):
+    # 一次遍历读出稀疏的 (顶点, 顶点组, 权重)
+    verts, groups, weights = [], [], []
+    for i, vert in enumerate(mesh.data.vertices):
+        for elem in vert.groups:
+            verts.append(i)
+            groups.append(elem.group)
+            weights.append(elem.weight)
+    return (np.array(verts, dtype=np.int32),
+            np.array(groups, dtype=np.int32),
+            np.array(weights, dtype=np.float32))
+
+
+# 权重缓存只在一次 execute 内有效：算子之间用户可能用 Blender 自带的工具改过权重，
+# 而 -b 下连续调用 bpy.ops 之间没有 depsgraph 更新，名字和顶点数又看不出内容变化
+weight_cache_scopes = []
+
+
+@contextmanager
+def weight_cache_scope():
+    # 可以嵌套，最外层结束时丢掉所有网格的权重
+    weight_cache_scopes.append(None)
+    try:
+        yield
+    finally:
+        weight_cache_scopes.pop()
+        if not weight_cache_scopes:
+            for key in analysis_cache.keys():
+                if key[0] == "weights":
+                    analysis_cache.pop(key)
+
+
+def read_vertex_weights(mesh, group_indices=None):
+    # weight_cache_scope 内整个网格的权重缓存在 analysis_cache 里，返回的数组是只读的
+    # 顶点组名字或顶点数变化时重新读；编辑模式下 mesh.data 不是最新的，不缓存
+    if mesh.mode == "EDIT" or not weight_cache_scopes:
+        rows = scan_vertex_weights(mesh)
+    else:
+        key = vertex_weights_key(mesh)
+        names = mesh.vertex_groups.keys()
+        entry = analysis_cache.get(key)
+        if entry is None or entry["names"] != names or entry["vertex_count"] != len(mesh.data.vertices):
+            profile_count("analysis cache miss")
+            rows = scan_vertex_weights(mesh)
+            for array in rows:
+                array.flags.writeable = False
+            entry = analysis_cache.put(key, {"names": names, "vertex_count": len(mesh.data.vertices), "rows": rows})
+        else:
+            profile_count("analysis cache hit")
+        rows = entry["rows"]
+    if group_indices is None:
+        return rows
+    wanted = np.isin(rows[1], np.asarray(list(group_indices), dtype=np.int32))
+    return tuple(array[wanted] for array in rows)
+
+
+@persistent
+def invalidate_analysis_cache(scene, depsgraph):
+    # 顶点权重的缓存只在 weight_cache_scope 内有效，这里只处理骨架
+    if not len(analysis_cache):
+        return
+    armatures = set()
+    relink = False
+    for update in depsgraph.updates:
+        id = update.id.original
+        if isinstance(id, bpy.types.Armature):
+            armatures.add(id.as_pointer())
+        elif isinstance(id, bpy.types.Object):
+            if id.type == "MESH":
+                relink = True
+        elif isinstance(id, (bpy.types.Collection, bpy.types.Scene)):
+            relink = True
+
+    for key in analysis_cache.keys():
+        if key[0] == "armature":
+            analysis = analysis_cache.entries[key]
+            if key[2] in armatures:
+                analysis.dirty = True
+            if relink:
+                analysis.meshes = None
+
+
+@persistent
+def clear_analysis_cache(*args):
+    analysis_cache.clear()
+
+
+def write_vertex_weights(mesh, verts, groups, weights):
+    # 同一组内相同权重的顶点一次 add
+    vertex_groups = mesh.vertex_groups
+    (verts, groups, weights), starts, ends = core.weights.weight_runs(verts, groups, weights)
+
+    locked = []
+    for group in np.unique(groups):
+        vg = vertex_groups[int(group)]
+        if vg.lock_weight:
+            vg.lock_weight = False
+            locked.append(vg)
+
+    for start, end in zip(starts, ends):
+        vg = vertex_groups[int(groups[start])]
+        vg.add(verts[start:end].tolist(), float(weights[start]), 'REPLACE')
+
+    for vg in locked:
+        vg.lock_weight = True
+    analysis_cache.pop(vertex_weights_key(mesh))
+
+
+def prepare_weight_merge(mesh, mapping: dict[str, str]):
+    # mapping 需要已经过 core.weights.resolve_merge_mapping
+    vertex_groups = mesh.vertex_groups
+    sources = [vg_from for vg_from in mapping if vg_from in vertex_groups]
+    if not sources:
+        return None
+
+    for vg_to in {mapping[vg_from] for vg_from in sources}:
+        if vg_to not in vertex_groups:
+            vertex_groups.new(name=vg_to)
+
+    remap = np.full(len(vertex_groups), -1, dtype=np.int32)
+    for vg_from in sources:
+        remap[vertex_groups[vg_from].index] = vertex_groups[mapping[vg_from]].index
+
+    used = np.flatnonzero(remap >= 0).tolist() + remap[remap >= 0].tolist()
+    return read_vertex_weights(mesh, used) + (remap,), sources
+
+
+def merge_vertex_groups_multi(meshes, mapping: dict[str, str], use_threads: bool = False) -> list[tuple[str, float]]:
+    # 映射表只解析一次，每个网格只读写一次权重
+    # 读写 bpy 数据必须在主线程，只有 NumPy 计算部分放进线程池
+    mapping = core.weights.resolve_merge_mapping(mapping)
+    timings = {}
+    jobs = []
+    with phase("weight read"):
+        for mesh in meshes:
+            start = time.perf_counter()
+            job = prepare_weight_merge(mesh, mapping)
+            timings[mesh.name] = time.perf_counter() - start
+            if job:
+                jobs.append((mesh, job))
+                profile_count("weights read", len(job[0][0]))
+
+    def compute(job):
+        start = time.perf_counter()
+        merged = core.weights.merge_weight_arrays(*job[0])
+        return merged, time.perf_counter() - start
+
+    with phase("weight merge"):
+        if use_threads and len(jobs) > 1:
+            with ThreadPoolExecutor() as pool:
+                results = list(pool.map(compute, [job for _, job in jobs]))
+        else:
+            results = [compute(job) for _, job in jobs]
+
+    with phase("weight write"):
+        for (mesh, (_, sources)), (merged, elapsed) in zip(jobs, results):
+            start = time.perf_counter()
+            write_vertex_weights(mesh, *merged)
+            for vg_from in sources:
+                mesh.vertex_groups.remove(mesh.vertex_groups[vg_from])
+            timings[mesh.name] += elapsed + time.perf_counter() - start
+
+    return sorted(timings.items(), key=lambda item: item[1], reverse=True)
+
+
+def merge_vertex_groups(mesh, mapping: dict[str, str]):
+    # 不依赖操作符上下文，也不需要切换活动形态键
+    merge_vertex_groups_multi([mesh], mapping)
+
+
+def format_timings(timings: list[tuple[str, float]]) -> str:
+    return ", ".join(f"{name} {elapsed * 1000:.1f}ms" for name, elapsed in timings)
 
 
 def merge_weights(mesh, vg_from: str, vg_to: str):
-    mesh.active_shape_key_index = 0
-    mod = mesh.modifiers.new("VertexWeightMix", 'VERTEX_WEIGHT_MIX')
-    mod.vertex_group_a = vg_to
-    mod.vertex_group_b = vg_from
-    mod.mix_mode = "ADD"
-    mod.mix_set = 'B'
-    mod.mask_constant = 1.0
-    bpy.ops.object.modifier_apply(modifier=mod.name)
-    mesh.vertex_groups.remove(mesh.vertex_groups.get(vg_from))
+    merge_vertex_groups(mesh, {vg_from: vg_to})
 
 
 def merge_bone(armature, tomerge, bone, keep_merged_bones: bool):
@@ -42,10 +444,69 @@ def merge_bone(armature, tomerge, bone, keep_merged_bones: bool):
             armature.data.edit_bones.remove(tomerge)
 
 
+def find_bone_pairs_by_distance(heads, threshold: float) -> list[tuple[int, int]]:
+    # 返回所有头部距离不超过阈值的 (i, j)，i < j，顺序与逐对比较时一致
+    return list(map(tuple, core.pairing.find_pairs_by_distance(heads, threshold).tolist()))
+
+
+def bone_merge_inputs(bone_data: BoneData, indices, by_bone_color: bool):
+    # 预览和合并都按 bone_data 的顺序取输入，缓存的候选下标才能对上
+    names = [bone_data.names[i] for i in indices]
+    heads = bone_data.heads[indices]
+    if by_bone_color is False:
+        in_group = bone_data.in_collection[indices].tolist()
+    else:
+        in_group = bone_data.colored[indices].tolist()
+    return names, heads, in_group
+
+
+# 骨架数据指针 -> 预览时算好的候选骨骼对
+merge_preview_cache = {}
+
+
 def set_active_obj(obj):
     bpy.context.view_layer.objects.active = obj
 
 
+def merge_bones_by_distance(armature, bones, threshold: float, keep_merged_bones: bool,
+                            by_bone_color: bool = False, merge_weight: bool = False,
+                            use_threads: bool = False):
+    # 骨架需要处于编辑模式，bones 为参与合并的编辑骨骼
+    edit_bones = {bone.name: bone for bone in bones}
+    bone_data = armature_analysis(armature).bones
+    bone_names, heads, in_group = bone_merge_inputs(bone_data, bone_data.indices(edit_bones), by_bone_color)
+    profile_count("bones visited", len(bone_names))
+
+    # 预览过且骨骼没有变化时直接用缓存的候选
+    with phase("pairing"):
+        candidates = merge_preview_cache.get(armature.data.as_pointer())
+        if (candidates is not None and threshold <= candidates["radius"]
+                and candidates["key"] == core.pairing.merge_key(bone_names, heads, in_group)):
+            pairs = core.pairing.pairs_within(candidates, threshold)
+        else:
+            pairs = find_bone_pairs_by_distance(heads, threshold)
+        clusters = core.unionfind.cluster_merge_pairs(pairs, in_group, heads)
+
+    # 每个簇只改一次：被合并的骨骼各出现一次，目标骨骼不会被删除
+    merging_list = []
+    with phase("edit bones"):
+        for a, b in clusters:
+            merging_list.append([bone_names[a], bone_names[b]])
+            tomerge = edit_bones[bone_names[a]]
+            tomerge.use_connect = False
+            tomerge.parent = edit_bones[bone_names[b]]
+            if not keep_merged_bones:
+                armature.data.edit_bones.remove(tomerge)
+    merge_preview_cache.pop(armature.data.as_pointer(), None)
+    invalidate_armature_analysis(armature)
+
+    timings = []
+    if merge_weight:
+        meshes = [obj for obj in armature.children if obj.type == 'MESH']
+        timings = merge_vertex_groups_multi(meshes, dict(merging_list), use_threads)
+    return len(merging_list), timings
+
+
 class OP_MergeBonesByDistance(bpy.types.Operator):
     bl_idname = "sourcecat.merge_bones"
     bl_label = "Merge Bones"
@@ -54,72 +515,25 @@ class OP_MergeBonesByDistance(bpy.types.Operator):
 
     merge_weight: bpy.props.BoolProperty(name="Merge Weights", default=False)
     ##keep_merged_bones: bpy.props.BoolProperty(name="Keep Merged Bones", default=False)
-    by_bone_color: bpy.props.BoolProperty(name="By Bone Color", default=False)
+    use_threads: bpy.props.BoolProperty(name="Multithread", default=False)
 
+    @instrumented
     def execute(self, context):
-        init_mode = context.object.mode
-        switch_mode('EDIT')
-
-        selected_bones = context.selected_bones
-        if selected_bones is None:
-            self.report({'ERROR'}, 'No selected bone')
-            return {'CANCELLED'}
-
-        armature = context.object
         scene = context.scene
-        merging_list = []
-        print(len(selected_bones))
-
-        result = 0
-        for i in range(len(selected_bones)):
-            boneA = selected_bones[i]
-            for i2 in range(i+1, len(selected_bones)):
-                boneB = selected_bones[i2]
-                d = boneA.head - boneB.head
-
-                if Decimal(d.length) <= Decimal(scene.merge_bones_threshold):
-                    aInGroup = False
-                    bInGroup = False
-
-                    if self.by_bone_color is False:
-                        if len(boneA.collections.keys()):
-                            aInGroup = True
-                        if len(boneB.collections.keys()):
-                            bInGroup = True
-                    else:
-                        if boneA.color.palette != "DEFAULT":
-                            aInGroup = True
-                        if boneB.color.palette != "DEFAULT":
-                            bInGroup = True
-
-                    
-                    if aInGroup != bInGroup:
-                        #print(boneA.collections, boneB.collections)
-                        if aInGroup:
-                            merging_list.append([boneB.name, boneA.name])
-                            boneB.use_connect = False
-                        elif bInGroup:
-                            merging_list.append([boneA.name, boneB.name])
-                            boneA.use_connect = False
-                        merge_bone(armature, merging_list[-1][0], merging_list[-1][1], scene.keep_merged_bones)
-                        result += 1
-        if self.merge_weight:
-            for obj in armature.children:
-                if obj.type != 'MESH':
-                    continue
-                for tomerge, bone in merging_list:
-                    vg_tomerge = obj.vertex_groups.get(tomerge)
-                    vg_bone = obj.vertex_groups.get(bone)
-                    if vg_tomerge:
-                        if vg_bone is None:
-                            obj.vertex_groups.new(name=bone)
-                        set_active_obj(obj)
-                        merge_weights(mesh=obj, vg_from=tomerge, vg_to=bone)
-        set_active_obj(armature)
-        switch_mode(init_mode)
+        with mode_session(context.object, 'EDIT'):
+            selected_bones = context.selected_bones
+            if not selected_bones:
+                self.report({'ERROR'}, 'No selected bone')
+                return {'CANCELLED'}
 
+            result, timings = merge_bones_by_distance(
+                context.object, selected_bones, scene.merge_bones_threshold, scene.keep_merged_bones,
+                scene.merge_bones_by_bone_color, self.merge_weight, self.use_threads)
 
-        self.report({"INFO"}, f"{result} bones edited.")
+        if timings:
+            self.report({"INFO"}, f"{result} bones edited. {format_timings(timings)}")
+        else:
+            self.report({"INFO"}, f"{result} bones edited.")
         return {'FINISHED'}
 
 
@@ -129,40 +543,35 @@ class OP_MergeToActive(bpy.types.Operator):
     bl_description = "在选中的骨骼里，将其它骨骼合并到激活的骨骼（包括权重）"
     bl_options = {'REGISTER', 'UNDO'}
 
+    use_threads: bpy.props.BoolProperty(name="Multithread", default=False)
+
+    @instrumented
     def execute(self, context):
-        selected_bones = context.selected_bones
-        if selected_bones is None:
+        armature = context.object
+        if armature is None or armature.type != "ARMATURE" or context.active_bone is None:
             self.report({'INFO'}, 'No selected bone')
             return {'CANCELLED'}
-        
-        active_bone = context.active_bone
 
-        armature = context.object
-        scene = context.scene
-        merging_list = []
-        for i in range(len(selected_bones)):
-            s_bone = selected_bones[i]
-            if s_bone == active_bone:
-                continue
-            print(s_bone)
-            merging_list.append(s_bone.name)
-            switch_mode('EDIT')
-            merge_bone(armature, s_bone.name, active_bone.name, scene.keep_merged_bones)
-            switch_mode("OBJECT")
+        # 选中的骨骼从 bones 读，不需要为此切换模式
+        active_name = context.active_bone.name
+        bone_data = armature_analysis(armature).bones
+        merging_list = [bone_data.names[i] for i in bone_data.selected() if bone_data.names[i] != active_name]
+        if not merging_list:
+            self.report({'INFO'}, 'No selected bone')
+            return {'CANCELLED'}
 
-        
-        for obj in bpy.context.scene.objects.get(armature.name).children:
-            if obj.type != 'MESH':
-                continue
-            for s_bone in merging_list:
-                vg_tomerge = obj.vertex_groups.get(s_bone)
-                if vg_tomerge:
-                    if obj.vertex_groups.get(active_bone.name) is None:
-                        obj.vertex_groups.new(name=active_bone.name)
-                    set_active_obj(obj)
-                    merge_weights(mesh=obj, vg_from=s_bone, vg_to=active_bone.name)
-        set_active_obj(armature)
-        switch_mode('EDIT')
+        scene = context.scene
+        with mode_session(armature, 'EDIT'):
+            for name in merging_list:
+                merge_bone(armature, name, active_name, scene.keep_merged_bones)
+            invalidate_armature_analysis(armature)
+
+            # 网格不在编辑模式，骨架停在编辑模式时也可以直接写权重
+            mapping = {name: active_name for name in merging_list}
+            meshes = [obj for obj in armature.children if obj.type == 'MESH']
+            timings = merge_vertex_groups_multi(meshes, mapping, self.use_threads)
+        if timings:
+            self.report({'INFO'}, format_timings(timings))
         return {'FINISHED'}
 
 
@@ -172,79 +581,514 @@ class OP_MergeBones_GetThreshold(bpy.types.Operator):
     bl_description = "根据两骨骼距离获取阈值"
     bl_options = {'REGISTER'}
 
+    @instrumented
+    def execute(self, context):
+        # 取激活骨骼到选中骨骼里最近的、能和它合并的骨骼的距离，和合并用同样的分组方式
+        scene = context.scene
+        armature = context.object
+        if context.active_bone is None:
+            self.report({'ERROR'}, 'No active bone')
+            return {'CANCELLED'}
+        bone_data = armature_analysis(armature).bones
+        names, heads, in_group = bone_merge_inputs(bone_data, bone_data.selected(), scene.merge_bones_by_bone_color)
+        if context.active_bone.name not in names:
+            self.report({'ERROR'}, 'No active bone')
+            return {'CANCELLED'}
+        active = names.index(context.active_bone.name)
+        others = [i for i in range(len(names)) if i != active and not (in_group[i] and in_group[active])]
+        if not others:
+            self.report({'ERROR'}, 'No bone to merge with')
+            return {'CANCELLED'}
+        scene.merge_bones_threshold = float(np.linalg.norm(heads[others] - heads[active], axis=1).min())
+        return {'FINISHED'}
+
+
+class OP_MergeBones_Preview(bpy.types.Operator):
+    bl_idname = "sourcecat.merge_bones_preview"
+    bl_label = "Preview"
+    bl_description = "预先计算选中骨骼在预览范围内的候选骨骼对，调整阈值时只更新统计，不修改骨骼"
+    bl_options = {'REGISTER'}
+
+    @instrumented
+    def execute(self, context):
+        # 只读 bones 数据，不切换模式
+        bone_data = armature_analysis(context.object).bones
+        selected = bone_data.selected()
+        if not len(selected):
+            self.report({'ERROR'}, 'No selected bone')
+            return {'CANCELLED'}
+
+        scene = context.scene
+        radius = max(scene.merge_bones_preview_range, scene.merge_bones_threshold)
+        inputs = bone_merge_inputs(bone_data, selected, scene.merge_bones_by_bone_color)
+        candidates = core.pairing.build_candidates(*inputs, radius)
+        merge_preview_cache[context.object.data.as_pointer()] = candidates
+
+        self.report({'INFO'}, f"{len(candidates['distances'])} candidate pairs.")
+        return {'FINISHED'}
+
+
+class OP_MergeBones_ClearPreview(bpy.types.Operator):
+    bl_idname = "sourcecat.merge_bones_clear_preview"
+    bl_label = "Clear Preview"
+    bl_options = {'REGISTER'}
+
+    @instrumented
     def execute(self, context):
-        boneA = context.active_bone.head
-        boneB = context.selected_editable_bones[-1].head
-        result = (boneA - boneB).length
-        context.scene.merge_bones_threshold = result
+        merge_preview_cache.pop(context.object.data.as_pointer(), None)
         return {'FINISHED'}
 
 
-class OP_CollapseMaterialName(bpy.types.Operator):
+# 材质 -> 基础色贴图名（None 表示没找到），depsgraph 更新时失效
+material_texture_cache = {}
+
+
+def socket_source_image(socket, group_stack: tuple, visited: set):
+    # 沿输入插槽的连线往上游找图像纹理节点，会进入节点组
+    for link in socket.links:
+        if link.is_muted:
+            continue
+        image = node_output_image(link.from_node, link.from_socket, group_stack, visited)
+        if image is not None:
+            return image
+    return None
+
+
+def node_output_image(node, socket, group_stack: tuple, visited: set):
+    key = (tuple(group.as_pointer() for group in group_stack), node.as_pointer(), socket.identifier)
+    if key in visited:
+        return None
+    visited.add(key)
+
+    if node.type == "TEX_IMAGE":
+        return node.image
+    if node.type == "GROUP":
+        if node.node_tree is None:
+            return None
+        for inner in node.node_tree.nodes:
+            if inner.type == "GROUP_OUTPUT" and inner.is_active_output:
+                for inner_socket in inner.inputs:
+                    if inner_socket.identifier == socket.identifier:
+                        return socket_source_image(inner_socket, group_stack + (node,), visited)
+        return None
+    if node.type == "GROUP_INPUT":
+        if not group_stack:
+            return None
+        outer = group_stack[-1]
+        for outer_socket in outer.inputs:
+            if outer_socket.identifier == socket.identifier:
+                return socket_source_image(outer_socket, group_stack[:-1], visited)
+        return None
+
+    # BSDF 只看基础色；其它节点先看着色器和颜色输入
+    base_color = node.inputs.get("Base Color")
+    if base_color is not None:
+        inputs = [base_color]
+    else:
+        inputs = sorted((s for s in node.inputs if s.is_linked),
+                        key=lambda s: s.type not in ("SHADER", "RGBA"))
+    for input_socket in inputs:
+        image = socket_source_image(input_socket, group_stack, visited)
+        if image is not None:
+            return image
+    return None
+
+
+def node_tree_texture(node_tree) -> str | None:
+    image = None
+    output = node_tree.get_output_node('ALL')
+    if output is not None and output.inputs.get("Surface") is not None:
+        image = socket_source_image(output.inputs["Surface"], (), set())
+    if image is None:
+        # 没有连到输出的贴图时和以前一样取第一个图像纹理节点
+        for node in node_tree.nodes:
+            if node.type == "TEX_IMAGE" and node.image:
+                image = node.image
+                break
+    return Path(image.name).stem if image is not None else None
+
+
+def resolve_material_texture(mat) -> str | None:
+    key = mat.name_full
+    if key not in material_texture_cache:
+        material_texture_cache[key] = node_tree_texture(mat.node_tree) if mat.node_tree else None
+    return material_texture_cache[key]
+
+
+@persistent
+def invalidate_material_texture_cache(scene, depsgraph):
+    if not material_texture_cache:
+        return
+    for update in depsgraph.updates:
+        id = update.id.original
+        if isinstance(id, bpy.types.Material):
+            material_texture_cache.pop(id.name_full, None)
+        elif isinstance(id, (bpy.types.NodeTree, bpy.types.Image)):
+            # 节点组和图片可能被很多材质共用
+            material_texture_cache.clear()
+            return
+
+
+def material_textures(objects) -> dict[str, str]:
+    # 共用的材质只处理一次，结果在多次调用间缓存
+    mat_tex_map = {}
+    seen = set()
+    for obj in objects:
+        if obj.type != "MESH":
+            continue
+        mesh: bpy.types.Mesh = obj.data
+        for mat in mesh.materials:
+            if mat is None or mat.name in seen:
+                continue
+            seen.add(mat.name)
+            tex = resolve_material_texture(mat)
+            if tex is not None:
+                mat_tex_map[mat.name] = tex
+    return mat_tex_map
+
+
+def iter_material_qc(objects):
+    return core.qc.iter_material_qc(material_textures(objects))
+
+
+def iter_bodygroup_qc(names):
+    return core.qc.iter_bodygroup_qc(names)
+
+
+def write_qc(chunks, output: str, context=None, filepath: str = "", text_name: str = "") -> int:
+    # 返回写出的字符数；剪贴板和文本块需要完整字符串，文件逐块写出
+    if output == "FILE":
+        size = 0
+        with open(bpy.path.abspath(filepath), "w", encoding="utf-8") as file:
+            for chunk in chunks:
+                file.write(chunk)
+                size += len(chunk)
+        return size
+
+    tmpStr = "".join(chunks)
+    if len(tmpStr) == 0:
+        return 0
+    if output == "TEXT":
+        text = bpy.data.texts.get(text_name) or bpy.data.texts.new(text_name)
+        text.clear()
+        text.write(tmpStr)
+    else:
+        (context or bpy.context).window_manager.clipboard = tmpStr
+    return len(tmpStr)
+
+
+class QCOutput:
+    output: bpy.props.EnumProperty(
+        name="Output",
+        default="CLIPBOARD",
+        items=[
+            ("CLIPBOARD", "剪贴板", ""),
+            ("FILE", "文件", ""),
+            ("TEXT", "文本", "写入文本数据块"),
+        ]
+    )
+    filepath: bpy.props.StringProperty(name="File", subtype="FILE_PATH")
+    text_name: bpy.props.StringProperty(name="Text", default="NekoTools.qc")
+
+    def write_qc(self, context, chunks) -> set[str]:
+        if self.output == "FILE" and not self.filepath:
+            self.report({"ERROR"}, "no file path")
+            return {"CANCELLED"}
+        size = write_qc(chunks, self.output, context, self.filepath, self.text_name)
+        self.report({"INFO"}, f"{size} characters written.")
+        return {"FINISHED"}
+
+
+class OP_CollapseMaterialName(QCOutput, bpy.types.Operator):
     bl_idname = "sourcecat.collapse_material_name"
     bl_label = "生成精简后的材质列表QC"
     bl_options = {'REGISTER', 'UNDO'}
 
+    @instrumented
     def execute(self, context: bpy.types.Context):
-        mat_tex_map = {}
-
-        for obj in context.selected_objects:
-            if obj.type != "MESH":
-                continue
-            mesh: bpy.types.Mesh = obj.data
-            for mat in mesh.materials:
-                node_tree = mat.node_tree
-                if not node_tree:
-                    continue
-                for node in node_tree.nodes:
-                    if node.type == "TEX_IMAGE" and node.image:
-                        mat_tex_map[mat.name] = Path(node.image.name).stem
-                        break
-        
-        result = {}
-        for mat in mat_tex_map:
-            tex = mat_tex_map[mat]
-            if tex not in result:
-                result[tex] = []
-            result[tex].append(mat)
-
-        tmpStr = ""
-        for tex in result:
-            for mat in result[tex]:
-                tmpStr += f'$PreRenameMaterial "{mat}" "{tex}"\n'
-            tmpStr += "\n"
-        if len(tmpStr) > 0:
-            context.window_manager.clipboard = tmpStr
-
-        return {'FINISHED'}
+        return self.write_qc(context, iter_material_qc(context.selected_objects))
 
 
-class OP_CopyBodyGroup(bpy.types.Operator):
+class OP_CopyBodyGroup(QCOutput, bpy.types.Operator):
     bl_idname = "sourcecat.copy_bodygroup"
     bl_label = "CopyBodyGroupQC"
     bl_options = {'REGISTER', 'UNDO'}
 
-    def _make_bg_qc(self, name: str) -> str:
-        tmpStr = f'$BodyGroup "{name}" '
-        tmpStr += "{\n"
-        tmpStr += f'\tstudio $custom_model$ InNode "{name}"\n\tblank\n'
-        tmpStr += "}\n"
-        return tmpStr
-
+    @instrumented
     def execute(self, context: bpy.types.Context):
-        tmpStr = ""
-        for id in context.selected_ids:
-            if id.rna_type.name != 'Collection':
-                continue
-            tmpStr += self._make_bg_qc(id.name)
-        
-        for obj in context.selected_objects:
-            tmpStr += self._make_bg_qc(obj.name)
+        names = [id.name for id in context.selected_ids if id.rna_type.name == 'Collection']
+        names += [obj.name for obj in context.selected_objects]
+        return self.write_qc(context, iter_bodygroup_qc(names))
+
+
+NORMAL_BACKUP = "neko_normal_bak"
+
+
+def backup_split_normals(mesh: bpy.types.Mesh):
+    normals_data = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+    mesh.loops.foreach_get("normal", normals_data)
+    mesh.attributes.new(NORMAL_BACKUP, "FLOAT_VECTOR", "CORNER").data.foreach_set("vector", normals_data)
+
+
+def restore_split_normals(mesh: bpy.types.Mesh) -> bool:
+    normal_bak = mesh.attributes.get(NORMAL_BACKUP)
+    if normal_bak is None:
+        return False
+    normals_data = np.empty(len(mesh.loops) * 3, dtype=np.float32)
+    normal_bak.data.foreach_get("vector", normals_data)
+    mesh.attributes.remove(normal_bak)
+    mesh.normals_split_custom_set(normals_data.reshape(-1, 3))
+    return True
+
+
+def separate_by_material(objects, engine: str = "EDIT") -> list:
+    # 所有网格一起进入编辑模式，一次拆分；返回拆分后得到的所有网格物体（包括原物体）
+    # UV、颜色属性、其它自定义属性和形态键 separate 本身会带过去，
+    # 只有自定义法线是按拆分前的拓扑存储的，需要先备份成普通属性
+    objects = [obj for obj in objects if obj.type == "MESH"]
+    if not objects:
+        return []
+
+    switch_mode("OBJECT")
+    if engine == "NUMPY":
+        results = []
+        with phase("separate"):
+            for obj in objects:
+                results += separate_by_material_numpy(obj)
+        return results
+
+    for obj in bpy.context.view_layer.objects.selected:
+        obj.select_set(False)
+    for obj in objects:
+        obj.select_set(True)
+    set_active_obj(objects[0])
+
+    meshes = {obj.data.as_pointer(): obj.data for obj in objects}
+    with phase("normals"):
+        for mesh in meshes.values():
+            backup_split_normals(mesh)
+
+    switch_mode("EDIT")
+    # 此方法会导致与单纯ctrl+p分离的网格顶点排序不一致，弃用
+    # for mat_slot in meshObj.material_slots.items():
+    #     meshObj.active_material_index = mat_slot[1].slot_index
+    #     bpy.ops.mesh.select_all(action="DESELECT")
+    #     bpy.ops.object.material_slot_select()
+    #     bpy.ops.mesh.split() 
+    profile_count("ops")
+    with phase("separate"):
+        bpy.ops.mesh.separate(type="MATERIAL")
 
-        if len(tmpStr) > 0:
-            context.window_manager.clipboard = tmpStr
+    switch_mode("OBJECT")
+    results = []
+    restored = set()
+    for obj in bpy.context.view_layer.objects:
+        if obj.type != "MESH":
+            continue
+        if obj.data.as_pointer() in restored or restore_split_normals(obj.data):
+            restored.add(obj.data.as_pointer())
+            results.append(obj)
+    return results
+
+
+ATTRIBUTE_FIELDS = {
+    "FLOAT": ("value", 1, np.float32),
+    "INT": ("value", 1, np.int32),
+    "INT8": ("value", 1, np.int8),
+    "BOOLEAN": ("value", 1, bool),
+    "FLOAT2": ("vector", 2, np.float32),
+    "INT32_2D": ("value", 2, np.int32),
+    "FLOAT_VECTOR": ("vector", 3, np.float32),
+    "FLOAT_COLOR": ("color", 4, np.float32),
+    "BYTE_COLOR": ("color", 4, np.float32),
+    "QUATERNION": ("value", 4, np.float32),
+}
 
-        return {'FINISHED'}
+
+def read_attribute(attribute) -> np.ndarray:
+    field, size, dtype = ATTRIBUTE_FIELDS[attribute.data_type]
+    data = np.empty(len(attribute.data) * size, dtype=dtype)
+    attribute.data.foreach_get(field, data)
+    return data.reshape(-1, size)
+
+
+def material_face_groups(mesh: bpy.types.Mesh) -> list[tuple[int, np.ndarray]]:
+    # 按材质第一次出现的顺序分组，与 separate(type="MATERIAL") 的拆分顺序一致
+    material_index = np.empty(len(mesh.polygons), dtype=np.int32)
+    mesh.polygons.foreach_get("material_index", material_index)
+    faces = np.argsort(material_index, kind="stable")
+    indices, first, counts = np.unique(material_index, return_index=True, return_counts=True)
+    groups = dict(zip(indices.tolist(), np.split(faces, np.cumsum(counts)[:-1])))
+    return [(int(indices[i]), groups[int(indices[i])]) for i in np.argsort(first)]
+
+
+def face_loops(loop_start, loop_total, faces):
+    totals = loop_total[faces]
+    new_starts = np.concatenate(([0], np.cumsum(totals)[:-1])).astype(np.int32)
+    loops = np.arange(totals.sum(), dtype=np.int32) + np.repeat(loop_start[faces] - new_starts, totals)
+    return loops, new_starts
+
+
+def build_material_part(source, template, geometry, faces, material_index):
+    # 保持原来的元素顺序（过滤而不重排），与 ctrl+p 拆出来的网格一致
+    src_mesh = source.data
+    loops, new_starts = face_loops(geometry["loop_start"], geometry["loop_total"], faces)
+    verts = np.unique(geometry["loop_vert"][loops])
+    edges = np.unique(geometry["loop_edge"][loops])
+    vert_map = np.full(len(src_mesh.vertices), -1, dtype=np.int32)
+    vert_map[verts] = np.arange(len(verts), dtype=np.int32)
+    edge_map = np.full(len(src_mesh.edges), -1, dtype=np.int32)
+    edge_map[edges] = np.arange(len(edges), dtype=np.int32)
+
+    mesh = template.copy()
+    mesh.vertices.add(len(verts))
+    mesh.edges.add(len(edges))
+    mesh.loops.add(len(loops))
+    mesh.polygons.add(len(faces))
+    mesh.vertices.foreach_set("co", geometry["co"][verts].ravel())
+    mesh.edges.foreach_set("vertices", vert_map[geometry["edge_verts"][edges]].ravel())
+    mesh.loops.foreach_set("vertex_index", vert_map[geometry["loop_vert"][loops]])
+    mesh.loops.foreach_set("edge_index", edge_map[geometry["loop_edge"][loops]])
+    mesh.polygons.foreach_set("loop_start", new_starts)
+
+    domains = {"POINT": verts, "EDGE": edges, "FACE": faces, "CORNER": loops}
+    for name, (domain, data_type, data) in geometry["attributes"].items():
+        attribute = mesh.attributes.get(name) or mesh.attributes.new(name, data_type, domain)
+        field = ATTRIBUTE_FIELDS[data_type][0]
+        attribute.data.foreach_set(field, data[domains[domain]].ravel())
+    for uv_layer in src_mesh.uv_layers:
+        if uv_layer.name in mesh.uv_layers:
+            mesh.uv_layers[uv_layer.name].active_render = uv_layer.active_render
+    if src_mesh.uv_layers.active:
+        mesh.uv_layers.active = mesh.uv_layers.get(src_mesh.uv_layers.active.name)
+    src_colors = src_mesh.color_attributes
+    if src_colors.active_color:
+        mesh.color_attributes.active_color = mesh.color_attributes.get(src_colors.active_color.name)
+    if 0 <= src_colors.render_color_index < len(src_colors):
+        render_name = src_colors[src_colors.render_color_index].name
+        mesh.color_attributes.render_color_index = mesh.color_attributes.find(render_name)
+    mesh.update()
+
+    obj = source.copy()
+    obj.data = mesh
+    for collection in source.users_collection:
+        collection.objects.link(obj)
+
+    key_blocks = geometry["shape_keys"]
+    for kb, co in key_blocks:
+        new_kb = obj.shape_key_add(name=kb.name, from_mix=False)
+        new_kb.data.foreach_set("co", co[verts].ravel())
+        new_kb.interpolation = kb.interpolation
+        new_kb.slider_min = kb.slider_min
+        new_kb.slider_max = kb.slider_max
+        new_kb.value = kb.value
+        new_kb.vertex_group = kb.vertex_group
+        new_kb.mute = kb.mute
+        new_kb.lock_shape = kb.lock_shape
+    if key_blocks:
+        new_blocks = mesh.shape_keys.key_blocks
+        for kb, _ in key_blocks:
+            new_blocks[kb.name].relative_key = new_blocks[kb.relative_key.name]
+        mesh.shape_keys.use_relative = src_mesh.shape_keys.use_relative
+
+    for vg in source.vertex_groups:
+        new_vg = obj.vertex_groups.get(vg.name) or obj.vertex_groups.new(name=vg.name)
+        new_vg.lock_weight = vg.lock_weight
+    w_verts, w_groups, w_weights = geometry["weights"]
+    rows = vert_map[w_verts] >= 0
+    write_vertex_weights(obj, vert_map[w_verts[rows]], w_groups[rows], w_weights[rows])
+    obj.vertex_groups.active_index = source.vertex_groups.active_index
+
+    mesh.materials.clear()
+    slot = source.material_slots[material_index] if material_index < len(source.material_slots) else None
+    mesh.materials.append(src_mesh.materials[material_index] if material_index < len(src_mesh.materials) else None)
+    if slot is not None and slot.link == 'OBJECT':
+        obj.material_slots[0].link = 'OBJECT'
+        obj.material_slots[0].material = slot.material
+
+    mesh.normals_split_custom_set(geometry["normals"][loops])
+    return obj
+
+
+def separate_by_material_numpy(source) -> list:
+    # 不进入编辑模式：按 material_index 分组后直接用 foreach_set 构建每个网格，
+    # 原物体保留最后一组（和 separate 一样），用 bmesh 删除其它面
+    import bmesh
+
+    src_mesh: bpy.types.Mesh = source.data
+    groups = material_face_groups(src_mesh)
+    if len(groups) < 2:
+        return [source]
+
+    num_loops = len(src_mesh.loops)
+    geometry = {
+        "co": np.empty(len(src_mesh.vertices) * 3, dtype=np.float32),
+        "edge_verts": np.empty(len(src_mesh.edges) * 2, dtype=np.int32),
+        "loop_vert": np.empty(num_loops, dtype=np.int32),
+        "loop_edge": np.empty(num_loops, dtype=np.int32),
+        "loop_start": np.empty(len(src_mesh.polygons), dtype=np.int32),
+        "loop_total": np.empty(len(src_mesh.polygons), dtype=np.int32),
+        "normals": np.empty(num_loops * 3, dtype=np.float32),
+    }
+    src_mesh.vertices.foreach_get("co", geometry["co"])
+    src_mesh.edges.foreach_get("vertices", geometry["edge_verts"])
+    src_mesh.loops.foreach_get("vertex_index", geometry["loop_vert"])
+    src_mesh.loops.foreach_get("edge_index", geometry["loop_edge"])
+    src_mesh.polygons.foreach_get("loop_start", geometry["loop_start"])
+    src_mesh.polygons.foreach_get("loop_total", geometry["loop_total"])
+    src_mesh.loops.foreach_get("normal", geometry["normals"])
+    geometry["co"] = geometry["co"].reshape(-1, 3)
+    geometry["edge_verts"] = geometry["edge_verts"].reshape(-1, 2)
+    geometry["normals"] = geometry["normals"].reshape(-1, 3)
+
+    geometry["attributes"] = {
+        attribute.name: (attribute.domain, attribute.data_type, read_attribute(attribute))
+        for attribute in src_mesh.attributes
+        if attribute.data_type in ATTRIBUTE_FIELDS and attribute.domain in ("POINT", "EDGE", "FACE", "CORNER")
+        and not attribute.name.startswith(".") and attribute.name not in ("position", "material_index")
+    }
+    geometry["shape_keys"] = []
+    if src_mesh.shape_keys:
+        for kb in src_mesh.shape_keys.key_blocks:
+            co = np.empty(len(kb.data) * 3, dtype=np.float32)
+            kb.data.foreach_get("co", co)
+            geometry["shape_keys"].append((kb, co.reshape(-1, 3)))
+    geometry["weights"] = read_vertex_weights(source)
+
+    # 只复制一次源网格作为模版：保留网格设置、材质和顶点组名，清掉几何和形态键
+    template = src_mesh.copy()
+    holder = bpy.data.objects.new(template.name, template)
+    holder.shape_key_clear()
+    bpy.data.objects.remove(holder)
+    template.clear_geometry()
+
+    results = []
+    for material_index, faces in groups[:-1]:
+        part = build_material_part(source, template, geometry, faces, material_index)
+        part.select_set(True)
+        results.append(part)
+    bpy.data.meshes.remove(template)
+
+    material_index, faces = groups[-1]
+    keep = np.zeros(len(src_mesh.polygons), dtype=bool)
+    keep[faces] = True
+    bm = bmesh.new()
+    bm.from_mesh(src_mesh)
+    bm.faces.ensure_lookup_table()
+    bmesh.ops.delete(bm, geom=[face for face, kept in zip(bm.faces, keep) if not kept], context="FACES")
+    for face in bm.faces:
+        face.material_index = 0
+    bm.to_mesh(src_mesh)
+    bm.free()
+
+    material = src_mesh.materials[material_index] if material_index < len(src_mesh.materials) else None
+    src_mesh.materials.clear()
+    src_mesh.materials.append(material)
+    loops, _ = face_loops(geometry["loop_start"], geometry["loop_total"], faces)
+    src_mesh.normals_split_custom_set(geometry["normals"][loops])
+    src_mesh.update()
+    results.append(source)
+    return results
 
 
 class OP_SeparateByMaterial(bpy.types.Operator):
@@ -253,46 +1097,119 @@ class OP_SeparateByMaterial(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
     bl_description = "请确保物体属性-数据-几何数据里有“清除自定义拆边法向数据”这个按钮"
 
+    engine: bpy.props.EnumProperty(
+        name="Engine",
+        default="EDIT",
+        items=[
+            ("EDIT", "编辑模式", "使用 ctrl+p 按材质分离"),
+            ("NUMPY", "NumPy", "不进入编辑模式，直接构建拆分后的网格"),
+        ]
+    )
+
+    @instrumented
     def execute(self, context: bpy.types.Context):
-        if len(context.selected_objects) > 1:
-            self.report({"ERROR"}, "multi object selected")
-            return {"CANCELLED"}
-        
-        meshObj = context.active_object
-        if meshObj.type != "MESH":
-            self.report({"ERROR"}, "actived object is not mesh")
+        objects = [obj for obj in context.selected_objects if obj.type == "MESH"]
+        if not objects:
+            self.report({"ERROR"}, "no mesh selected")
             return {"CANCELLED"}
         
         init_mode = context.object.mode
-        
-
-        switch_mode("OBJECT")
-        normal_bak = meshObj.data.attributes.new("neko_normal_bak", "FLOAT_VECTOR", "CORNER")
-        normals_data = np.empty(meshObj.data.attributes.domain_size("CORNER") * 3, dtype=np.float32)
-        meshObj.data.loops.foreach_get("normal", normals_data)
-        normal_bak.data.foreach_set("vector", normals_data)
-
-        switch_mode("EDIT")
-        # 此方法会导致与单纯ctrl+p分离的网格顶点排序不一致，弃用
-        # for mat_slot in meshObj.material_slots.items():
-        #     meshObj.active_material_index = mat_slot[1].slot_index
-        #     bpy.ops.mesh.select_all(action="DESELECT")
-        #     bpy.ops.object.material_slot_select()
-        #     bpy.ops.mesh.split() 
-        bpy.ops.mesh.separate(type="MATERIAL")
+        results = separate_by_material(objects, self.engine)
+        switch_mode(init_mode)
 
-        switch_mode("OBJECT")
-        for obj in context.selected_objects:
-            normal_bak = obj.data.attributes.get("neko_normal_bak")
-            if normal_bak:
-                normals_data = np.empty(obj.data.attributes.domain_size("CORNER") * 3, dtype=np.float32)
-                normal_bak.data.foreach_get("vector", normals_data)
-                obj.data.normals_split_custom_set(normals_data.reshape(-1,3))
-                obj.data.attributes.remove(normal_bak)
+        self.report({"INFO"}, f"{len(objects)} meshes separated into {len(results)}.")
+        return {'FINISHED'}
 
 
-        switch_mode(init_mode)
-        return {'FINISHED'}
+def unique_bone_name(name: str, taken) -> str:
+    index = 1
+    while f"{name}.{index:03d}" in taken:
+        index += 1
+    return f"{name}.{index:03d}"
+
+
+def merge_armatures(target: bpy.types.Object, sources: list[bpy.types.Object],
+                    tolerance: float = 0.0001) -> tuple[int, list[str]]:
+    # 把多个骨架一次合并到 target，同名且世界空间位置在容差内的骨骼嫁接到 target 的骨骼上
+    # 同名但位置不同的骨骼不嫁接，改名后保留并报告，返回 (嫁接数, 冲突骨骼名)
+    switch_mode("OBJECT")
+    for obj in bpy.context.view_layer.objects.selected:
+        obj.select_set(False)
+    for obj in [target] + sources:
+        obj.select_set(True)
+    set_active_obj(target)
+    switch_mode("EDIT")
+
+    # 名字 -> 世界空间 (head, tail)，每合并一个骨架就把它剩下的骨骼加进来
+    placed = {bone.name: (target.matrix_world @ bone.head, target.matrix_world @ bone.tail)
+              for bone in target.data.edit_bones}
+    parent_backup = {}
+    conflicts = []
+    grafted = 0
+    for source in sources:
+        edit_bones = source.data.edit_bones
+        taken = placed.keys() | set(edit_bones.keys())
+        shared = []
+        for bone in list(edit_bones):
+            if bone.name not in placed:
+                continue
+            head, tail = source.matrix_world @ bone.head, source.matrix_world @ bone.tail
+            placed_head, placed_tail = placed[bone.name]
+            if (head - placed_head).length <= tolerance and (tail - placed_tail).length <= tolerance:
+                shared.append(bone)
+            else:
+                conflicts.append(bone.name)
+                bone.name = unique_bone_name(bone.name, taken)
+                taken.add(bone.name)
+
+        # EditBone.children 每次都遍历所有骨骼，先一次建好 父级 -> 子级
+        children = {}
+        for bone in edit_bones:
+            if bone.parent is not None:
+                children.setdefault(bone.parent.name, []).append(bone)
+        shared_names = {bone.name for bone in shared}
+        for bone in shared:
+            for child in children.get(bone.name, []):
+                if child.name not in shared_names:
+                    parent_backup[child.name] = (bone.name, child.use_connect)
+        for bone in shared:
+            edit_bones.remove(bone)
+        grafted += len(shared)
+
+        for bone in edit_bones:
+            placed[bone.name] = (source.matrix_world @ bone.head, source.matrix_world @ bone.tail)
+
+    switch_mode("OBJECT")
+
+    # 场景里所有指向被合并骨架的修改器都改到 target
+    for obj in bpy.context.scene.objects:
+        for modifier in obj.modifiers:
+            if modifier.type == "ARMATURE" and modifier.object in sources:
+                modifier.object = target
+
+    # 子物体改为以 target 为父级，保持世界变换
+    target_inverse = target.matrix_world.inverted()
+    for source in sources:
+        for child in source.children:
+            world = child.matrix_world.copy()
+            child.parent = target
+            child.parent_type = "OBJECT"
+            child.matrix_parent_inverse = target_inverse
+            child.matrix_world = world
+
+    profile_count("ops")
+    with phase("join"), bpy.context.temp_override(active_object=target, selected_editable_objects=[target] + sources):
+        bpy.ops.object.join()
+
+    switch_mode("EDIT")
+    edit_bones = {bone.name: bone for bone in target.data.edit_bones}
+    for bone_name, (parent_name, use_connect) in parent_backup.items():
+        bone = edit_bones[bone_name]
+        bone.parent = edit_bones[parent_name]
+        bone.use_connect = use_connect
+    switch_mode("OBJECT")
+    invalidate_armature_analysis(target)
+    return grafted, conflicts
 
 
 class OP_MergeArmature(bpy.types.Operator):
@@ -300,77 +1217,114 @@ class OP_MergeArmature(bpy.types.Operator):
     bl_label = "合并骨架"
     bl_options = {'REGISTER', 'UNDO'}
     bl_description = "自动嫁接同名骨骼"
-
+    tolerance: bpy.props.FloatProperty(name="容差", default=0.0001, min=0.0, precision=5,
+                                       description="同名骨骼的世界空间位置相差超过容差时不嫁接")
+    reorder_vertex_groups: bpy.props.BoolProperty(name="整理顶点组顺序", default=True,
+                                                  description="合并后把绑定网格已有的顶点组按骨骼顺序重排")
+    pad_vertex_groups: bpy.props.BoolProperty(name="补齐空顶点组", default=False,
+                                              description="重排时给没有顶点组的骨骼补一个空组，使顶点组下标等于骨骼下标")
+
+    @instrumented
     def execute(self, context: bpy.types.Context):
         init_mode = context.object.mode
 
         merge_to = context.active_object
-        to_merge = None
+        if merge_to is None or merge_to.type != "ARMATURE":
+            self.report({"ERROR"}, "活动项不是骨架")
+            return {'CANCELLED'}
+
+        to_merge = [obj for obj in context.selected_objects if obj != merge_to and obj.type == "ARMATURE"]
+        if not to_merge:
+            self.report({"ERROR"}, "需要选中至少两个骨架")
+            return {'CANCELLED'}
 
         try:
-            if merge_to.type != "ARMATURE":
-                self.report({"ERROR"}, "活动项不是骨架")
-                raise
-
-            for obj in context.selected_objects:
-                if obj.name != merge_to.name and obj.type == merge_to.type:
-                    to_merge = obj
-                    break
-            if to_merge is None or len(context.selected_objects) != 2:
-                self.report({"ERROR"}, "需要选中两个骨架")
-                raise
-
-            switch_mode("EDIT")
-
-            for bone in to_merge.data.edit_bones:
-                if merge_to.data.edit_bones.find(bone.name) != -1:
-                    bone.parent = None
-            
-            parent_backup = {}
-            for bone in to_merge.data.edit_bones:
-                if merge_to.data.edit_bones.find(bone.name) != -1:
-                    for child in bone.children:
-                        parent_backup[child.name] = bone.name
-                    to_merge.data.edit_bones.remove(bone)
-
-            switch_mode("OBJECT")
-            bpy.ops.object.select_all(action="DESELECT")
-
-            for child in to_merge.children:
-                for modifier in child.modifiers:
-                    modifier: bpy.types.ArmatureModifier = modifier
-                    if modifier.type != "ARMATURE":
-                        continue
-                    if modifier.object == to_merge:
-                        modifier.object = merge_to
-                child.select_set(True)
-
-            bpy.ops.object.parent_clear(type="CLEAR_KEEP_TRANSFORM")
-            merge_to.select_set(True)
-            bpy.ops.object.parent_set()
-
-            bpy.ops.object.select_all(action="DESELECT")
-
-            to_merge.select_set(True)
-            merge_to.select_set(True)
-            bpy.ops.object.join()
-
-            switch_mode("EDIT")
-
-            for bone_name in parent_backup:
-                parent_bone_idx = merge_to.data.edit_bones.find(parent_backup[bone_name])
-                bone_idx = merge_to.data.edit_bones.find(bone_name)
-                merge_to.data.edit_bones[bone_idx].parent = merge_to.data.edit_bones[parent_bone_idx]
-
-        except Exception:
+            grafted, conflicts = merge_armatures(merge_to, to_merge, self.tolerance)
+            if self.reorder_vertex_groups:
+                bone_lookup = {name: i for i, name in enumerate(merge_to.data.bones.keys())}
+                for mesh in find_armature_meshes(merge_to, context.scene.objects):
+                    reorder_vertex_groups(mesh, bone_lookup, self.pad_vertex_groups)
+        except Exception as error:
+            self.report({"ERROR"}, f"合并失败: {error}")
             return {'CANCELLED'}
         finally:
             switch_mode(init_mode)
-        
-        
+
+        if conflicts:
+            print("conflicting bones:", ", ".join(conflicts))
+            self.report({"WARNING"}, f"合并了 {len(to_merge)} 个骨架，嫁接 {grafted} 根骨骼，"
+                                     f"{len(conflicts)} 根同名骨骼位置不同，已改名保留")
+        else:
+            self.report({"INFO"}, f"合并了 {len(to_merge)} 个骨架，嫁接 {grafted} 根骨骼")
         return {'FINISHED'}
 
 
+BONE_MAP_DIR = Path(__file__).parent / "presets" / "bone_maps"
+
+# 预设 id -> {"name": 显示名, "rename"/"copy_location"/"snap"/"parent": [(a, b), ...]}
+bone_map_presets = {}
+bone_map_enum_items = {}
+
+
+def load_bone_map_presets():
+    bone_map_presets.clear()
+    directories = [BONE_MAP_DIR]
+    user_dir = bpy.utils.user_resource('CONFIG', path="nekotools/bone_maps")
+    if user_dir:
+        directories.append(Path(user_dir))
+
+    def skip(path, e):
+        print(f"NekoTools: skip bone map {path}: {e}")
+
+    bone_map_presets.update(core.name_map.load_bone_maps(directories, skip))
+
+
+def get_bone_map(preset: str, section: str) -> list[tuple[str, str]]:
+    if not bone_map_presets:
+        load_bone_map_presets()
+    return bone_map_presets.get(preset, {}).get(section, [])
+
+
+def bone_map_enum(section: str):
+    def items(self, context):
+        if not bone_map_presets:
+            load_bone_map_presets()
+        # 动态枚举项需要保持引用
+        bone_map_enum_items[section] = [(key, preset["name"], "") for key, preset in bone_map_presets.items()
+                                        if preset[section]] or [("NONE", "None", "")]
+        return bone_map_enum_items[section]
+    return items
+
+
+def rename_bones(armature: bpy.types.Armature, pairs, reverse: bool = False) -> tuple[int, list[str]]:
+    # 名字表每个骨架只建一次；返回 (重命名数量, 没有出现在映射表里的骨骼)
+    bones = {bone.name: bone for bone in armature.bones}
+    renames, unmapped = core.name_map.plan_renames(list(bones), pairs, reverse)
+    for name, new_name in renames:
+        bones[name].name = new_name
+    if renames:
+        invalidate_armature_analysis(armature)
+    return len(renames), unmapped
+
+
+def reparent_bones(armature: bpy.types.Armature, pairs) -> int:
+    # pairs 为 (父级, 子级)，骨架需要处于编辑模式
+    edit_bones = {bone.name: bone for bone in armature.edit_bones}
+    count = 0
+    for parent, child in pairs:
+        if parent in edit_bones and child in edit_bones:
+            edit_bones[child].parent = edit_bones[parent]
+            count += 1
+    if count:
+        invalidate_armature_analysis(armature)
+    return count
+
+
+def valve_bone_rename(armature: bpy.types.Armature, reverse: bool = False,
+                      preset: str = "valve_biped") -> tuple[int, list[str]]:
+    return rename_bones(armature, get_bone_map(preset, "rename"), reverse)
+
+
 class OP_ValveBoneRename(bpy.types.Operator):
     bl_idname = "sourcecat.valve_bone_rename"
     bl_label = "Valve骨名转换"
@@ -378,7 +1332,9 @@ class OP_ValveBoneRename(bpy.types.Operator):
     bl_description = "在ValveBiped和适合blender的V骨名之间转换"
 
     reverse: bpy.props.BoolProperty(name="reverse", default=False)
+    preset: bpy.props.EnumProperty(name="Preset", items=bone_map_enum("rename"))
 
+    @instrumented
     def execute(self, context: bpy.types.Context):
         if context.active_object.type != "ARMATURE":
             self.report({'ERROR'}, 'no active armature')
@@ -388,88 +1344,13 @@ class OP_ValveBoneRename(bpy.types.Operator):
         armature: bpy.types.Armature = context.active_object.data
         switch_mode("EDIT")
 
-        renamed_count = 0
-        def rn(name: str, new_name: str):
-            nonlocal renamed_count
-            if self.reverse:
-                tmp = new_name
-                new_name = name
-                name = tmp
-            bone_index = armature.bones.find(name)
-            if bone_index != -1:
-                armature.bones[bone_index].name = new_name
-                renamed_count += 1
-
-        rn("ValveBiped.Bip01_Head1", "V_Head1")
-        rn("ValveBiped.Bip01_Neck1", "V_Neck1")
-        rn("ValveBiped.Bip01_Spine4", "V_Spine4")
-        rn("ValveBiped.Bip01_Spine2", "V_Spine2")
-        rn("ValveBiped.Bip01_Spine1", "V_Spine1")
-        rn("ValveBiped.Bip01_Spine", "V_Spine")
-        rn("ValveBiped.Bip01_Pelvis", "V_Pelvis")
-        rn("ValveBiped.Bip01_L_Toe0", "V_Toe0_L")
-        rn("ValveBiped.Bip01_L_Foot", "V_Foot_L")
-        rn("ValveBiped.Bip01_L_Calf", "V_Calf_L")
-        rn("ValveBiped.Bip01_L_Thigh", "V_Thigh_L")
-        rn("ValveBiped.Bip01_R_Toe0", "V_Toe0_R")
-        rn("ValveBiped.Bip01_R_Foot", "V_Foot_R")
-        rn("ValveBiped.Bip01_R_Calf", "V_Calf_R")
-        rn("ValveBiped.Bip01_R_Thigh", "V_Thigh_R")
-        rn("ValveBiped.Bip01_L_Finger02", "V_Finger02_L")
-        rn("ValveBiped.Bip01_L_Finger01", "V_Finger01_L")
-        rn("ValveBiped.Bip01_L_Finger0", "V_Finger0_L")
-        rn("ValveBiped.Bip01_L_Finger12", "V_Finger12_L")
-        rn("ValveBiped.Bip01_L_Finger11", "V_Finger11_L")
-        rn("ValveBiped.Bip01_L_Finger1", "V_Finger1_L")
-        rn("ValveBiped.Bip01_L_Finger22", "V_Finger22_L")
-        rn("ValveBiped.Bip01_L_Finger21", "V_Finger21_L")
-        rn("ValveBiped.Bip01_L_Finger2", "V_Finger2_L")
-        rn("ValveBiped.Bip01_L_Finger32", "V_Finger32_L")
-        rn("ValveBiped.Bip01_L_Finger31", "V_Finger31_L")
-        rn("ValveBiped.Bip01_L_Finger3", "V_Finger3_L")
-        rn("ValveBiped.Bip01_L_Finger42", "V_Finger42_L")
-        rn("ValveBiped.Bip01_L_Finger41", "V_Finger41_L")
-        rn("ValveBiped.Bip01_L_Finger4", "V_Finger4_L")
-        rn("ValveBiped.Bip01_L_Hand", "V_Hand_L")
-        rn("ValveBiped.Bip01_L_Forearm", "V_Forearm_L")
-        rn("ValveBiped.Bip01_L_UpperArm", "V_UpperArm_L")
-        rn("ValveBiped.Bip01_L_Clavicle", "V_Clavicle_L")
-        rn("ValveBiped.Bip01_R_Finger02", "V_Finger02_R")
-        rn("ValveBiped.Bip01_R_Finger01", "V_Finger01_R")
-        rn("ValveBiped.Bip01_R_Finger0", "V_Finger0_R")
-        rn("ValveBiped.Bip01_R_Finger12", "V_Finger12_R")
-        rn("ValveBiped.Bip01_R_Finger11", "V_Finger11_R")
-        rn("ValveBiped.Bip01_R_Finger1", "V_Finger1_R")
-        rn("ValveBiped.Bip01_R_Finger22", "V_Finger22_R")
-        rn("ValveBiped.Bip01_R_Finger21", "V_Finger21_R")
-        rn("ValveBiped.Bip01_R_Finger2", "V_Finger2_R")
-        rn("ValveBiped.Bip01_R_Finger32", "V_Finger32_R")
-        rn("ValveBiped.Bip01_R_Finger31", "V_Finger31_R")
-        rn("ValveBiped.Bip01_R_Finger3", "V_Finger3_R")
-        rn("ValveBiped.Bip01_R_Finger42", "V_Finger42_R")
-        rn("ValveBiped.Bip01_R_Finger41", "V_Finger41_R")
-        rn("ValveBiped.Bip01_R_Finger4", "V_Finger4_R")
-        rn("ValveBiped.Bip01_R_Hand", "V_Hand_R")
-        rn("ValveBiped.Bip01_R_Forearm", "V_Forearm_R")
-        rn("ValveBiped.Bip01_R_UpperArm", "V_UpperArm_R")
-        rn("ValveBiped.Bip01_R_Clavicle", "V_Clavicle_R")
-
-        rn("ValveBiped.Bip01_R_Forearm_driven", "V_Forearm_driven_R")
-        rn("ValveBiped.Bip01_R_Driven_ulna", "V_Driven_ulna_R")
-        rn("ValveBiped.Bip01_R_wrist_helper2", "V_wrist_helper2_R")
-        rn("ValveBiped.Bip01_R_wrist_helper1", "V_wrist_helper1_R")
-        rn("ValveBiped.Bip01_R_thumbroot", "V_thumbroot_R")
-
-        rn("ValveBiped.Bip01_L_Forearm_driven", "V_Forearm_driven_L")
-        rn("ValveBiped.Bip01_L_Driven_ulna", "V_Driven_ulna_L")
-        rn("ValveBiped.Bip01_L_wrist_helper2", "V_wrist_helper2_L")
-        rn("ValveBiped.Bip01_L_wrist_helper1", "V_wrist_helper1_L")
-        rn("ValveBiped.Bip01_L_thumbroot", "V_thumbroot_L")
-
+        renamed_count, unmapped = valve_bone_rename(armature, self.reverse, self.preset)
 
         switch_mode(init_mode)
 
-        self.report({'INFO'}, f"{renamed_count} bones renamed.")
+        if unmapped:
+            print("unmapped bones:", ", ".join(unmapped))
+        self.report({'INFO'}, f"{renamed_count} bones renamed, {len(unmapped)} unmapped.")
         return {'FINISHED'}  
 
 
@@ -479,6 +1360,9 @@ class OP_VToMMD(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
     bl_description = "选中两个骨架，活动项为MMD骨架。两个骨架的姿态方向需要大致相同"
 
+    preset: bpy.props.EnumProperty(name="Preset", items=bone_map_enum("copy_location"))
+
+    @instrumented
     def execute(self, context: bpy.types.Context):
         init_mode = context.object.mode
         
@@ -492,81 +1376,21 @@ class OP_VToMMD(bpy.types.Operator):
         switch_mode("POSE")
 
         v_mappings: bpy.props.CollectionProperty = bpy.data.armatures[v.name].kumopult_bac.mappings
-        def vmap(f: str, t: str):
+        for f, t in get_bone_map(self.preset, "copy_location"):
             item = v_mappings.add()
             item.has_loccopy = True
             item.selected_owner = f
             item.target = t
 
-        vmap("V_Neck1", "Neck")
-        vmap("V_Head1", "Head")
-            
-        vmap("V_Finger0_L", "Thumb0_L")
-        vmap("V_Finger0_R", "Thumb0_R")
-        vmap("V_Finger01_L", "Thumb1_L")
-        vmap("V_Finger01_R", "Thumb1_R")
-        vmap("V_Finger02_L", "Thumb2_L")
-        vmap("V_Finger02_R", "Thumb2_R")
-
-        vmap("V_Hand_R", "Wrist_R")
-        vmap("V_Hand_L", "Wrist_L")
-
-        vmap("V_Foot_R", "Ankle_R")
-        vmap("V_Foot_L", "Ankle_L")
-
-        vmap("V_Thigh_R", "Leg_R")
-        vmap("V_Thigh_L", "Leg_L")
-        vmap("V_Calf_R", "Knee_R")
-        vmap("V_Calf_L", "Knee_L")
-
-        vmap("V_UpperArm_R", "Arm_R")
-        vmap("V_UpperArm_L", "Arm_L")
-        vmap("V_Forearm_R", "Elbow_R")
-        vmap("V_Forearm_L", "Elbow_L")
-
-        vmap("V_Finger1_L", "IndexFinger1_L")
-        vmap("V_Finger1_R", "IndexFinger1_R")
-        vmap("V_Finger11_L", "IndexFinger2_L")
-        vmap("V_Finger11_R", "IndexFinger2_R")
-        vmap("V_Finger12_L", "IndexFinger3_L")
-        vmap("V_Finger12_R", "IndexFinger3_R")
-
-        vmap("V_Finger2_L", "MiddleFinger1_L")
-        vmap("V_Finger2_R", "MiddleFinger1_R")
-        vmap("V_Finger21_L", "MiddleFinger2_L")
-        vmap("V_Finger21_R", "MiddleFinger2_R")
-        vmap("V_Finger22_L", "MiddleFinger3_L")
-        vmap("V_Finger22_R", "MiddleFinger3_R")
-
-        vmap("V_Finger3_L", "RingFinger1_L")
-        vmap("V_Finger3_R", "RingFinger1_R")
-        vmap("V_Finger31_L", "RingFinger2_L")
-        vmap("V_Finger31_R", "RingFinger2_R")
-        vmap("V_Finger32_L", "RingFinger3_L")
-        vmap("V_Finger32_R", "RingFinger3_R")
-
-        vmap("V_Finger4_L", "LittleFinger1_L")
-        vmap("V_Finger4_R", "LittleFinger1_R")
-        vmap("V_Finger41_L", "LittleFinger2_L")
-        vmap("V_Finger41_R", "LittleFinger2_R")
-        vmap("V_Finger42_L", "LittleFinger3_L")
-        vmap("V_Finger42_R", "LittleFinger3_R")
-
-        
-        def snap(f: str, t: str):
+        v_bones = {bone.name: bone for bone in v.bones}
+        mmd_bones = {bone.name: bone for bone in mmd.bones}
+        for f, t in get_bone_map(self.preset, "snap"):
+            if f not in v_bones or t not in mmd_bones:
+                continue
             bpy.ops.pose.select_all(action="DESELECT")
-            v.bones.active = v.bones[v.bones.find(f)]
-            mmd.bones.active = mmd.bones[mmd.bones.find(t)]
+            v.bones.active = v_bones[f]
+            mmd.bones.active = mmd_bones[t]
             bpy.ops.view3d.snap_selected_to_active()
-        
-        snap("V_Toe0_R", "ToeTip_R")
-        snap("V_Toe0_L", "ToeTip_L")
-        snap("V_Spine", "UpperBody")
-        snap("V_Spine1", "UpperBody")
-        snap("V_Spine2", "UpperBody2")
-        snap("V_Spine4", "UpperBody2")
-        snap("V_Clavicle_R", "Shoulder_R")
-        snap("V_Clavicle_L", "Shoulder_L")
 
         switch_mode(init_mode)
         return {'FINISHED'}
@@ -577,6 +1401,9 @@ class OP_MMDBoneToVParent(bpy.types.Operator):
     bl_label = "设置mmd骨父级到v骨"
     bl_options = {'REGISTER', 'UNDO'}
 
+    preset: bpy.props.EnumProperty(name="Preset", items=bone_map_enum("parent"))
+
+    @instrumented
     def execute(self, context: bpy.types.Context):
         if context.active_object.type != "ARMATURE":
             self.report({'ERROR'}, 'no active armature')
@@ -586,84 +1413,21 @@ class OP_MMDBoneToVParent(bpy.types.Operator):
         armature: bpy.types.Armature = context.active_object.data
         switch_mode("EDIT")
 
-        def rp(p: str, b: str):
-            armature.edit_bones[armature.edit_bones.find(b)].parent = armature.edit_bones[armature.edit_bones.find(p)]
-
-
-
-        #rp("V_Spine", "UpperBody")
-        rp("V_Spine1", "UpperBody")
-        #rp("V_Spine2", "UpperBody2")
-        rp("V_Spine4", "UpperBody2")
-        rp("V_Pelvis", "ParentNode")
-        rp("V_Pelvis", "LowerBody")
-
-        rp("V_Clavicle_R", "Shoulder_R")
-        rp("V_Clavicle_L", "Shoulder_L")
-        rp("V_Neck1", "Neck")
-        rp("V_Head1", "Head")
-        rp("V_Finger0_L", "Thumb0_L")
-        rp("V_Finger0_R", "Thumb0_R")
-        rp("V_Finger01_L", "Thumb1_L")
-        rp("V_Finger01_R", "Thumb1_R")
-        rp("V_Finger02_L", "Thumb2_L")
-        rp("V_Finger02_R", "Thumb2_R")
-        rp("V_Hand_R", "Wrist_R")
-        rp("V_Hand_L", "Wrist_L")
-
-        rp("V_Toe0_R", "ToeTip_R")
-        rp("V_Toe0_L", "ToeTip_L")
-        rp("V_Toe0_R", "LegTipEX_R")
-        rp("V_Toe0_L", "LegTipEX_L")
-
-        rp("V_Foot_R", "Ankle_R")
-        rp("V_Foot_L", "Ankle_L")
-        rp("V_Foot_R", "AnkleD_R")
-        rp("V_Foot_L", "AnkleD_L")
-
-        rp("V_Calf_R", "Knee_R")
-        rp("V_Calf_L", "Knee_L")
-        rp("V_Calf_R", "KneeD_R")
-        rp("V_Calf_L", "KneeD_L")
-
-        rp("V_Thigh_R", "Leg_R")
-        rp("V_Thigh_L", "Leg_L")
-        rp("V_Thigh_R", "LegD_R")
-        rp("V_Thigh_L", "LegD_L")
-
-
-        rp("V_UpperArm_R", "Arm_R")
-        rp("V_UpperArm_L", "Arm_L")
-        rp("V_Forearm_R", "Elbow_R")
-        rp("V_Forearm_L", "Elbow_L")
-        rp("V_Finger1_L", "IndexFinger1_L")
-        rp("V_Finger1_R", "IndexFinger1_R")
-        rp("V_Finger11_L", "IndexFinger2_L")
-        rp("V_Finger11_R", "IndexFinger2_R")
-        rp("V_Finger12_L", "IndexFinger3_L")
-        rp("V_Finger12_R", "IndexFinger3_R")
-        rp("V_Finger2_L", "MiddleFinger1_L")
-        rp("V_Finger2_R", "MiddleFinger1_R")
-        rp("V_Finger21_L", "MiddleFinger2_L")
-        rp("V_Finger21_R", "MiddleFinger2_R")
-        rp("V_Finger22_L", "MiddleFinger3_L")
-        rp("V_Finger22_R", "MiddleFinger3_R")
-        rp("V_Finger3_L", "RingFinger1_L")
-        rp("V_Finger3_R", "RingFinger1_R")
-        rp("V_Finger31_L", "RingFinger2_L")
-        rp("V_Finger31_R", "RingFinger2_R")
-        rp("V_Finger32_L", "RingFinger3_L")
-        rp("V_Finger32_R", "RingFinger3_R")
-        rp("V_Finger4_L", "LittleFinger1_L")
-        rp("V_Finger4_R", "LittleFinger1_R")
-        rp("V_Finger41_L", "LittleFinger2_L")
-        rp("V_Finger41_R", "LittleFinger2_R")
-        rp("V_Finger42_L", "LittleFinger3_L")
-        rp("V_Finger42_R", "LittleFinger3_R")
+        count = reparent_bones(armature, get_bone_map(self.preset, "parent"))
 
         switch_mode(init_mode)
 
-        self.report({'INFO'}, 'DONE')
+        self.report({'INFO'}, f'{count} bones reparented.')
+        return {'FINISHED'}
+
+
+class OP_ClearProfileLog(bpy.types.Operator):
+    bl_idname = "nekotools.clear_profile_log"
+    bl_label = "清空性能记录"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        profile_log.clear()
         return {'FINISHED'}
 
 
@@ -693,10 +1457,22 @@ class VIEW_3D_PT_nekotools(bpy.types.Panel):
         row.prop(scene, "keep_merged_bones", text="不删除骨骼")
         row.operator(OP_MergeToActive.bl_idname, text="合并到激活")
 
+        col.prop(scene, "merge_bones_by_bone_color", text="按骨骼颜色分组")
+
         row = col.row()
         row.scale_y = 1.6
         row.operator(OP_MergeBonesByDistance.bl_idname, text="合并🐾")
 
+        row = col.row(align=True)
+        row.prop(scene, "merge_bones_preview_range", text="预览范围")
+        row.operator(OP_MergeBones_Preview.bl_idname, icon="HIDE_OFF", text="")
+        obj = context.object
+        if obj and obj.type == "ARMATURE":
+            candidates = merge_preview_cache.get(obj.data.as_pointer())
+            if candidates is not None:
+                row.operator(OP_MergeBones_ClearPreview.bl_idname, icon="X", text="")
+                self.draw_merge_preview(col.box(), candidates, scene.merge_bones_threshold)
+
         col = box.column()
         col.scale_y = 1.2
         col.operator(OP_CollapseMaterialName.bl_idname)
@@ -708,8 +1484,46 @@ class VIEW_3D_PT_nekotools(bpy.types.Panel):
         row.operator(OP_MMDBoneToVParent.bl_idname)
 
         col.operator(OP_RemoveUnweightedBones.bl_idname)
+        col.operator(OP_CleanupWeights.bl_idname)
         col.operator(OP_ValveBoneRename.bl_idname)
 
+        box = layout.box()
+        row = box.row()
+        row.prop(scene, "profile_operators", text="性能记录")
+        if scene.profile_operators:
+            row.prop(scene, "profile_cprofile", text="cProfile")
+            row.operator(OP_ClearProfileLog.bl_idname, icon="TRASH", text="")
+            self.draw_profile_log(box.column(align=True))
+
+    @staticmethod
+    def draw_profile_log(layout, limit: int = 8):
+        if not profile_log:
+            layout.label(text="执行任意操作后在这里显示用时")
+            return
+        for record in reversed(list(profile_log)[-limit:]):
+            layout.label(text=f"{record['operator']}  {record['seconds'] * 1000:.1f}ms", icon="TIME")
+            for name, elapsed in sorted(record["phases"].items(), key=lambda item: item[1], reverse=True):
+                layout.label(text=f"    {name}  {elapsed * 1000:.1f}ms")
+            if record["counters"]:
+                layout.label(text="    " + ", ".join(f"{name} {value}" for name, value in record["counters"].items()))
+
+    @staticmethod
+    def draw_merge_preview(layout, candidates: dict, threshold: float):
+        pairs = core.pairing.pairs_within(candidates, threshold)
+        merged = core.unionfind.cluster_merge_pairs(pairs, candidates["in_group"], candidates["heads"])
+        col = layout.column(align=True)
+        col.label(text=f"{len(pairs)} 对候选，将合并 {len(merged)} 个骨骼")
+        if threshold > candidates["radius"]:
+            col.label(text="阈值超出预览范围", icon="ERROR")
+
+        counts, edges = np.histogram(candidates["distances"], bins=8, range=(0.0, candidates["radius"]))
+        peak = max(counts.max(initial=0), 1)
+        for count, low, high in zip(counts, edges[:-1], edges[1:]):
+            row = col.row()
+            row.active = bool(low <= threshold)
+            row.label(text=f"{low:.6f} - {high:.6f}")
+            row.label(text="█" * int(round(count / peak * 12)) + f" {count}")
+
 
 # resutn posebone or editbone
 def get_selected_bones(context: bpy.types.Context):
@@ -725,6 +1539,7 @@ class OP_SelectedBonesToClipboard(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
     pattern: bpy.props.StringProperty(name="模版", default="$BoneMerge \"$$\"") # type: ignore
     
+    @instrumented
     def execute(self, context: bpy.types.Context):
         copied_num = 0
         result = ''
@@ -749,90 +1564,325 @@ class OP_SelectBones1(bpy.types.Operator):
     bl_label = "选择平级链平级骨"
     bl_options = {'REGISTER', 'UNDO'}
     same_prefix: bpy.props.BoolProperty(name="相同前缀", default=True)
+    all_selected: bpy.props.BoolProperty(name="所有选中骨骼", default=False,
+                                         description="每个选中的骨骼都作为参考，同时选择多个父级下的平级骨")
 
+    @instrumented
     def execute(self, context: bpy.types.Context):
-        chain_parent = context.active_bone
-        if chain_parent.parent is None:
-            return {'FINISHED'}
-        
-        in_chain_depth = 0
+        if context.object.type != "ARMATURE" or context.active_bone is None:
+            return {'CANCELLED'}
+        active_name = context.active_bone.name
         init_mode = context.object.mode
         switch_mode("EDIT")
 
-        selected_bones = {}
-        for bone in get_selected_bones(context):
-            selected_bones[bone.name] = True
-
-        def set_edit_bone_select(bone: bpy.types.EditBone, state: bool):
-            bone.select = state
-            bone.select_head = state
-            bone.select_tail = state
+        edit_bones = context.object.data.edit_bones
+        analysis = armature_analysis(context.object)
+        if analysis.bones.names == edit_bones.keys():
+            index = analysis.chain_index()
+        else:
+            index = core.chains.BoneChainIndex.from_bones(edit_bones)
+        state = {}
+        for attr in ("select", "select_head", "select_tail", "hide", "hide_select"):
+            state[attr] = np.zeros(len(index), dtype=bool)
+            edit_bones.foreach_get(attr, state[attr])
+        # 与 select_similar 一样只考虑可见的骨骼，隐藏的骨骼集合里的骨骼也算隐藏
+        state["hide"] |= hidden_by_collections(edit_bones)
+
+        if self.all_selected:
+            references = np.flatnonzero(state["select"])
+        else:
+            references = [index.lookup[active_name]]
 
-        while True:
-            ref_chain_root = chain_parent.name
-            chain_parent = chain_parent.parent
-            if len(chain_parent.children) > 2 or chain_parent.parent is None:
-                break
-            in_chain_depth += 1
-        
-        if self.same_prefix:
-            context_override = {}
-            if (context.object.type != "ARMATURE"):
-                return {'CANCELLED'}
-            context_override["active_bone"] = context.object.data.edit_bones[ref_chain_root]
-            with context.temp_override(**context_override):
-                bpy.ops.armature.select_similar(type="PREFIX")
-                selected_prefix_bones = {}
-                for bone in get_selected_bones(context):
-                    selected_prefix_bones[bone.name] = True
-
-        def select_bone_in_detph(bone, depth):
-            if depth <= 0 and not (bone.hide_select or bone.hide):
-                if self.same_prefix:
-                    # if bone.name not in selected_prefix_bones:
-                    #     return
-                    selected_bones[bone.name] = True
-                set_edit_bone_select(bone, True)
-                return
-            for bone_child in bone.children:
-                select_bone_in_detph(bone_child, depth-1)
-                break
-        
-        for bone in chain_parent.children:
-            if self.same_prefix and bone.name not in selected_prefix_bones:
+        targets = np.zeros(len(index), dtype=bool)
+        for ref_chain_root in references:
+            chain_parent = index.parent[ref_chain_root]
+            if chain_parent < 0:
                 continue
-            select_bone_in_detph(bone, in_chain_depth)
+            # 往上找到分叉点，记下参考骨骼在链里的深度
+            in_chain_depth = 0
+            while index.child_count[chain_parent] <= 2 and index.parent[chain_parent] >= 0:
+                ref_chain_root = chain_parent
+                chain_parent = index.parent[chain_parent]
+                in_chain_depth += 1
+
+            chain_roots = index.children(chain_parent)
+            if self.same_prefix:
+                # 和 select_similar 一样，没有前缀时只保留已选中的，前缀匹配只算可见骨骼
+                allowed = state["select"].copy()
+                prefix = core.chains.bone_name_prefix(index.names[ref_chain_root])
+                if prefix:
+                    members = index.with_prefix(prefix)
+                    allowed[members[~state["hide"][members]]] = True
+                chain_roots = chain_roots[allowed[chain_roots]]
+
+            for chain_root in chain_roots:
+                target = index.descend(chain_root, in_chain_depth)
+                if target >= 0:
+                    targets[target] = True
+
+        targets &= ~(state["hide"] | state["hide_select"])
+        for attr in ("select", "select_head", "select_tail"):
+            edit_bones.foreach_set(attr, state[attr] | targets)
 
-        if self.same_prefix:
-            for bone in get_selected_bones(context):
-                if bone.name not in selected_bones:
-                    set_edit_bone_select(bone, False)
-        
         switch_mode(init_mode)
         return {'FINISHED'}
 
 
+def shape_key_name_mask(names: list[str], filter_mode: str = "NONE", pattern: str = "") -> np.ndarray:
+    if filter_mode == "PREFIX":
+        return np.fromiter((name.startswith(pattern) for name in names), dtype=bool, count=len(names))
+    if filter_mode == "REGEX":
+        regex = re.compile(pattern)
+        return np.fromiter((regex.search(name) is not None for name in names), dtype=bool, count=len(names))
+    return np.ones(len(names), dtype=bool)
+
+
+def set_shape_key_mute(key: bpy.types.Key, options: str, protect_locked: bool = True,
+                       filter_mode: str = "NONE", pattern: str = "") -> int:
+    # 整体读写 mute / lock_shape，返回改变的形态键数量
+    key_blocks = key.key_blocks
+    count = len(key_blocks)
+    mute = np.zeros(count, dtype=bool)
+    key_blocks.foreach_get("mute", mute)
+
+    mask = np.ones(count, dtype=bool)
+    if protect_locked:
+        locked = np.zeros(count, dtype=bool)
+        key_blocks.foreach_get("lock_shape", locked)
+        mask &= ~locked
+    if filter_mode != "NONE":
+        mask &= shape_key_name_mask([block.name for block in key_blocks], filter_mode, pattern)
+
+    if options == "INVERT":
+        new_mute = np.where(mask, ~mute, mute)
+    else:
+        new_mute = np.where(mask, options == "MUTE", mute)
+    changed = int(np.count_nonzero(new_mute != mute))
+    if changed:
+        key_blocks.foreach_set("mute", new_mute)
+    return changed
+
+
 class OP_SetAllShapeKeyMuteState(bpy.types.Operator):
     bl_idname = "nekotools.set_all_shape_key_mute_state"
     bl_label = "设置所有形态键屏蔽状态"
     bl_options = {'REGISTER', 'UNDO'}
     options: bpy.props.StringProperty(name="options", default="INVERT")
     protect_locked: bpy.props.BoolProperty(name="protect_locked", default=True)
+    filter_mode: bpy.props.EnumProperty(
+        name="名称过滤",
+        default="NONE",
+        items=[
+            ("NONE", "全部", ""),
+            ("PREFIX", "前缀", "名称以 pattern 开头"),
+            ("REGEX", "正则", "名称匹配正则表达式 pattern"),
+        ]
+    )
+    pattern: bpy.props.StringProperty(name="pattern", default="")
 
+    @instrumented
     def execute(self, context: bpy.types.Context):
-        if self.options == "INVERT":
-            for shape_key in context.object.data.shape_keys.key_blocks:
-                if not self.protect_locked or not shape_key.lock_shape:
-                    shape_key.mute = not shape_key.mute
-        else:
-            state = self.options == "MUTE"
-            for shape_key in context.object.data.shape_keys.key_blocks:
-                if not self.protect_locked or not shape_key.lock_shape:
-                    shape_key.mute = state
-        
+        if self.filter_mode == "REGEX":
+            try:
+                re.compile(self.pattern)
+            except re.error as error:
+                self.report({'ERROR'}, f"正则表达式错误: {error}")
+                return {'CANCELLED'}
+
+        # 活动物体加上所有选中的网格
+        objects = [context.object] if context.object is not None else []
+        objects += [obj for obj in context.selected_objects if obj not in objects]
+        keys = {obj.data.shape_keys for obj in objects if obj.type == "MESH" and obj.data.shape_keys is not None}
+
+        changed = 0
+        for key in keys:
+            changed += set_shape_key_mute(key, self.options, self.protect_locked, self.filter_mode, self.pattern)
+        self.report({'INFO'}, f"{len(keys)} 个网格，修改了 {changed} 个形态键")
         return {'FINISHED'}
 
 
+def analyze_shape_keys(obj: bpy.types.Object, epsilon: float = 1e-4, sketch_size: int = 16, seed: int = 0) -> dict:
+    # 逐个读取形态键坐标，和它的 relative_key 相减得到位移，统计非零顶点数和最大位移
+    # 每个位移向量再投影成一个短的随机草图，草图相近的形态键才逐个比较是否重复
+    key_blocks = obj.data.shape_keys.key_blocks
+    count = len(key_blocks)
+    size = len(obj.data.vertices) * 3
+    names = [block.name for block in key_blocks]
+    lookup = {name: i for i, name in enumerate(names)}
+    relative = np.array([lookup[block.relative_key.name] for block in key_blocks], dtype=np.int32)
+    vertex_groups = [block.vertex_group for block in key_blocks]
+
+    # 参考形态键和被其他形态键当作 relative_key 的不能删除
+    protected = np.zeros(count, dtype=bool)
+    protected[0] = True
+    protected[relative[relative != np.arange(count)]] = True
+
+    def read_coords(i: int) -> np.ndarray:
+        coords = np.empty(size, dtype=np.float32)
+        key_blocks[i].data.foreach_get("co", coords)
+        return coords
+
+    bases = {}
+    def read_delta(i: int) -> np.ndarray:
+        # 位移不超过 epsilon 的顶点按零处理，统计和比较重复时都一样
+        if relative[i] not in bases:
+            bases[relative[i]] = read_coords(relative[i])
+        delta = (read_coords(i) - bases[relative[i]]).reshape(-1, 3)
+        lengths = np.linalg.norm(delta, axis=1)
+        delta[lengths <= epsilon] = 0.0
+        return delta.reshape(-1), lengths
+
+    projection = np.random.default_rng(seed).standard_normal((size, sketch_size), dtype=np.float32)
+    projection /= np.sqrt(sketch_size)
+    nonzero = np.zeros(count, dtype=np.int64)
+    max_displacement = np.zeros(count, dtype=np.float32)
+    sketches = np.zeros((count, sketch_size), dtype=np.float32)
+    for i in range(count):
+        if relative[i] == i:
+            continue
+        delta, lengths = read_delta(i)
+        nonzero[i] = np.count_nonzero(lengths > epsilon)
+        max_displacement[i] = lengths.max(initial=0.0)
+        sketches[i] = delta @ projection
+
+    empty = np.flatnonzero((nonzero == 0) & (relative != np.arange(count)))
+
+    # 重复：relative_key 和顶点组相同，且位移差的每个分量都不超过 epsilon
+    # 真正重复时位移差的模长不超过 epsilon * sqrt(分量数)，草图距离留两倍余量，候选再逐个精确比较
+    clusters = core.unionfind.UnionFind(count)
+    duplicate = np.zeros(count, dtype=bool)
+    candidates = np.flatnonzero(nonzero > 0)
+    groups = {}
+    for i in candidates:
+        groups.setdefault((relative[i], vertex_groups[i]), []).append(i)
+    deltas = {}
+    for members in groups.values():
+        if len(members) < 2:
+            continue
+        members = np.array(members)
+        distances = np.linalg.norm(sketches[members, None, :] - sketches[None, members, :], axis=2)
+        limit = 2.0 * epsilon * np.sqrt(size)
+        for a, b in zip(*np.nonzero(np.triu(distances <= limit, k=1))):
+            a, b = members[a], members[b]
+            for i in (a, b):
+                if i not in deltas:
+                    deltas[i] = read_delta(i)[0]
+            if np.allclose(deltas[a], deltas[b], rtol=0.0, atol=epsilon):
+                clusters.union(a, b)
+                duplicate[a] = duplicate[b] = True
+
+    duplicates = {}
+    for i in np.flatnonzero(duplicate):
+        duplicates.setdefault(clusters.find(i), []).append(int(i))
+
+    return {
+        "names": names,
+        "nonzero": nonzero,
+        "max_displacement": max_displacement,
+        "protected": protected,
+        "empty": [int(i) for i in empty],
+        "duplicates": list(duplicates.values()),
+        "vertex_count": size // 3,
+    }
+
+
+def compact_shape_keys(obj: bpy.types.Object, analysis: dict, remove_empty: bool, merge_duplicates: bool) -> list[str]:
+    # 重复的形态键保留每组第一个（组里有受保护的就保留它），其余删除
+    names = analysis["names"]
+    protected = analysis["protected"]
+    removed = []
+    if remove_empty:
+        removed += [names[i] for i in analysis["empty"] if not protected[i]]
+    if merge_duplicates:
+        for members in analysis["duplicates"]:
+            keep = next((i for i in members if protected[i]), members[0])
+            removed += [names[i] for i in members if i != keep and not protected[i]]
+    key_blocks = obj.data.shape_keys.key_blocks
+    for name in dict.fromkeys(removed):
+        obj.shape_key_remove(key_blocks[name])
+    return list(dict.fromkeys(removed))
+
+
+class OP_AnalyzeShapeKeys(bpy.types.Operator):
+    bl_idname = "nekotools.analyze_shape_keys"
+    bl_label = "分析形态键"
+    bl_description = "统计每个形态键的非零顶点和最大位移，找出空的和重复的形态键"
+    bl_options = {'REGISTER', 'UNDO'}
+    action: bpy.props.EnumProperty(
+        name="操作",
+        default="REPORT",
+        items=[
+            ("REPORT", "报告", "只统计，不修改"),
+            ("REMOVE_EMPTY", "删除空形态键", ""),
+            ("MERGE_DUPLICATES", "合并重复形态键", "重复的形态键只保留一个"),
+        ]
+    )
+    epsilon: bpy.props.FloatProperty(name="容差", default=0.0001, min=0.0, precision=6)
+
+    @classmethod
+    def poll(cls, context: bpy.types.Context):
+        obj = context.object
+        return obj is not None and obj.type == "MESH" and obj.data.shape_keys is not None
+
+    @instrumented
+    def execute(self, context: bpy.types.Context):
+        obj = context.object
+        start = time.perf_counter()
+        analysis = analyze_shape_keys(obj, self.epsilon)
+        names = analysis["names"]
+        nonzero = analysis["nonzero"]
+        duplicates = analysis["duplicates"]
+
+        for i in analysis["empty"]:
+            print("empty shape key:", names[i])
+        for members in duplicates:
+            print("duplicate shape keys:", ", ".join(names[i] for i in members))
+        dense = len(names) * analysis["vertex_count"]
+        ratio = nonzero.sum() / dense if dense else 0.0
+
+        removed = []
+        if self.action != "REPORT":
+            removed = compact_shape_keys(obj, analysis, self.action == "REMOVE_EMPTY", self.action == "MERGE_DUPLICATES")
+
+        self.report({'INFO'}, f"{len(names)} 个形态键，空 {len(analysis['empty'])} 个，重复 {len(duplicates)} 组，"
+                              f"非零顶点 {ratio:.1%}，删除 {len(removed)} 个，用时 {time.perf_counter() - start:.2f}s")
+        return {'FINISHED'}
+
+
+def apply_chain_decimation(edit_bones, bones: list, index: "core.chains.BoneChainIndex", chain: np.ndarray, kept: np.ndarray, heads=None):
+    # chain 为链上骨骼在 index 里的下标，kept 为保留的链内位置（升序），heads 为它们的新头部位置
+    # 被删除骨骼的子级接到链上最近的保留骨骼，保留骨骼的尾部接到下一个保留骨骼的头部
+    branches = [index.children(i) for i in chain]
+    chain = [bones[i] for i in chain]
+    end_tail = chain[-1].tail.copy()
+    connected = [bone.use_connect for bone in chain]
+    for bone in chain:
+        bone.use_connect = False
+
+    keep_mask = np.zeros(len(chain), dtype=bool)
+    keep_mask[kept] = True
+    nearest = np.maximum.accumulate(np.where(keep_mask, np.arange(len(chain)), -1))
+
+    kept_bones = [chain[i] for i in kept]
+    if heads is not None:
+        for bone, head in zip(kept_bones, heads):
+            bone.head = head
+
+    removed = np.flatnonzero(~keep_mask)
+    for i in removed:
+        for child in branches[i]:
+            bones[child].use_connect = False
+            bones[child].parent = chain[nearest[i]]
+    for i in removed:
+        edit_bones.remove(chain[i])
+
+    for bone, next_bone in zip(kept_bones, kept_bones[1:]):
+        bone.tail = next_bone.head
+    kept_bones[-1].tail = end_tail
+    for i, bone in zip(kept[1:], kept_bones[1:]):
+        bone.use_connect = connected[i]
+
+
 class OP_DecimateBoneChain(bpy.types.Operator):
     bl_idname = "nekotools.decimate_bone_chain"
     bl_label = "精简"
@@ -843,44 +1893,15 @@ class OP_DecimateBoneChain(bpy.types.Operator):
         name="Algorithm", 
         default="2",
         items=[
-            ("1", "曲线", ""),
+            ("1", "曲线", "Ramer–Douglas–Peucker，按比率保留偏离最大的点"),
             ("2", "相隔", ""),
             ("3", "边", ""),
+            ("4", "曲率", "按比率保留转角最大的点"),
         ]
     )
     iterations: bpy.props.IntProperty(name="Iterations", default=1, min=0)
     ratio: bpy.props.FloatProperty(name="曲线比率", default=0.5, min=0.0, max=1.0)
 
-    def _garb_bone_chain_vertices_(self, bone: bpy.types.EditBone, bm: bmesh.types.BMesh):
-        bm.verts.new(bone.head)
-        for child in bone.children:
-            self._garb_bone_chain_vertices_(child, bm)
-            break
-
-    def _update_bone_chain(self, bone: bpy.types.EditBone, bm: bmesh.types.BMesh, context: bpy.types.Context = None, deep: int = 0):
-        need_remove = False
-        if deep >= len(bm.verts):
-            need_remove = True
-        else:
-            bone.use_connect = False
-            tail_delta = bone.tail - bone.head
-            bone.head = bm.verts[deep].co
-            bone.tail = bone.head + tail_delta
-
-
-        for child in bone.children:
-            self._update_bone_chain(child, bm, context, deep=deep+1)
-
-            if need_remove:
-                context.active_object.data.edit_bones.remove(bone)
-            break
-
-    def _update_bone_chain_tail(self, bone: bpy.types.EditBone):
-        for child in bone.children:
-            bone.tail = child.head
-            self._update_bone_chain_tail(child)
-            break
-        
     def _get_bone_chain_root_list(self, context: bpy.types.Context) -> list[bpy.types.EditBone]:
         bone_chain_roots: list[bpy.types.EditBone] = []
         for bone in context.selected_editable_bones:
@@ -888,231 +1909,283 @@ class OP_DecimateBoneChain(bpy.types.Operator):
                 bone_chain_roots.append(bone)
         return bone_chain_roots
 
-    def execute_1(self, context: bpy.types.Context):
-
-        bone_chain_roots = self._get_bone_chain_root_list(context)
-
-        bone_chain_root_name_list = []
-        for bone in bone_chain_roots:
-            bone_chain_root_name_list.append(bone.name)
-        
-        bone_chain_roots.clear()
-
-
-        points = []
-        def _garb_bone_chain_points(bone: bpy.types.EditBone):
-            points.append(bone.head)
-            for child in bone.children:
-                _garb_bone_chain_points(child)
-                break
-
-        armature = context.active_object
-
-
-        for bone_name in bone_chain_root_name_list:
-            
-            points = []
-            _garb_bone_chain_points(armature.data.edit_bones.get(bone_name))
-
-            curve_data = bpy.data.curves.new(f"curves_{bone_name}", type='CURVE')
-            curve_data.dimensions = '3D'
-
-            spline = curve_data.splines.new('BEZIER')
-            spline.bezier_points.add(len(points)-1)
-            
-
-            for i, coord in enumerate(points):
-                spline.bezier_points[i].co = coord
-                spline.bezier_points[i].handle_left_type = 'AUTO'
-                spline.bezier_points[i].handle_right_type = 'AUTO'
-
-
-            curve_obj = bpy.data.objects.new(curve_data.name, curve_data)
-            #curve_obj.update_from_editmode()
-            context.collection.objects.link(curve_obj)
-
-           
-            bpy.ops.object.mode_set(mode='OBJECT')
-            curve_obj.select_set(state=True)
-            context.view_layer.objects.active = curve_obj
-           
-
-            bpy.ops.object.mode_set(mode='EDIT')
-            bpy.ops.curve.select_all(action='SELECT')   
-            bpy.ops.curve.decimate(ratio=self.ratio)
-
-            bpy.ops.object.mode_set(mode='OBJECT')
-            context.view_layer.objects.active = armature
-            bpy.ops.object.mode_set(mode='EDIT')
-
-            spline = curve_obj.data.splines[0]
-            def _update_bone_chain_by_spine(bone: bpy.types.EditBone, point_index: int):
-                need_remove = False
-                
-                if len(spline.bezier_points) > 0:
-                   print(len(spline.bezier_points))
-                   pass
-                if point_index >= len(spline.bezier_points):
-                    need_remove = True
-                elif spline.bezier_points[point_index].co != bone.head:
-                    need_remove = True
-                else:
-                    point_index += 1
-
-                for child in bone.children:
-                    if need_remove:
-                        child.parent = bone.parent
-                    _update_bone_chain_by_spine(child, point_index)
-                    break
-                if need_remove:
-                    armature.data.edit_bones.remove(bone)
-                    pass
-
-            bone = armature.data.edit_bones.get(bone_name)
-            _update_bone_chain_by_spine(bone, 0)
-            self._update_bone_chain_tail(bone)
-
-            context.collection.objects.unlink(curve_obj)
-            bpy.data.objects.remove(curve_obj)
-            bpy.data.curves.remove(curve_data)
-            curve_data = None
-            curve_obj = None
-
-        
-        return {'FINISHED'}
-
-    def execute_2(self, context: bpy.types.Context):
-        bone_chain_roots = self._get_bone_chain_root_list(context)
-
-
-        need_removes = []
-        def _test2(bone: bpy.types.EditBone, need_remove: bool = False):
-            for child in bone.children:
-                if need_remove:
-                    child.parent = bone.parent
-                _test2(child, need_remove=not need_remove)
-                break
-
-            if need_remove:
-                if len(bone.children) == 0:
-                    bone.parent.tail = bone.tail
-                bone.parent = None
-                need_removes.append(bone)
-
-
-        for i in range(self.iterations):
-            for bone in bone_chain_roots:
-                _test2(bone, False)
-
-        for bone in bone_chain_roots:
-            self._update_bone_chain_tail(bone)
-
-        for bone in need_removes:
-            context.active_object.data.edit_bones.remove(bone)
-
-
-        return {'FINISHED'}
-
-    def execute_3(self, context: bpy.types.Context):
-
-        bone_chain_roots = self._get_bone_chain_root_list(context)
-
-        for bone in bone_chain_roots:
-            print(bone.name)
-            
-            bm: bmesh.types.BMesh = bmesh.new()
-            self._garb_bone_chain_vertices_(bone, bm)
-            bm.verts.ensure_lookup_table()
-
-            num_vertices = len(bm.verts)
-            if num_vertices < 2:
+    @instrumented
+    def execute(self, context: bpy.types.Context):
+        edit_bones = context.active_object.data.edit_bones
+        bones = list(edit_bones)
+        index = core.chains.BoneChainIndex.from_bones(bones)
+
+        # 修改前一次取出所有链，每条链只沿第一个子级走
+        chains = [index.chain_from(index.lookup[root.name]) for root in self._get_bone_chain_root_list(context)]
+
+        processed = np.zeros(len(index), dtype=bool)
+        for chain in chains:
+            # 链尾可能穿过另一条选中链的链首，已经处理过的部分不再处理
+            overlap = np.flatnonzero(processed[chain])
+            if len(overlap):
+                chain = chain[:overlap[0]]
+            processed[chain] = True
+            if len(chain) < 2:
                 continue
-            for i in range(num_vertices - 1):
-                
-                bm.edges.new((bm.verts[i], bm.verts[i+1]))
-
-            if self.iterations > 0:
-                bmesh.ops.unsubdivide(bm, verts=bm.verts, iterations=self.iterations)
-                bm.verts.ensure_lookup_table()
-
-            if False: #test
-                mesh_data = bpy.data.meshes.new("test_data")
-                bm.to_mesh(mesh_data)
-                mesh_obj = bpy.data.objects.new("test", mesh_data)
-                bpy.context.collection.objects.link(mesh_obj)
-                    
+            points = np.array([bones[i].head for i in chain], dtype=np.float64)
+            kept, heads = core.decimate.decimate_chain(points, self.algorithm, self.iterations, self.ratio)
+            apply_chain_decimation(edit_bones, bones, index, chain, kept, heads)
+        invalidate_armature_analysis(context.active_object)
 
-            self._update_bone_chain(bone, bm, context)
-            self._update_bone_chain_tail(bone)
-
-            bm.free()
-        
         return {'FINISHED'}
 
-
-    def execute(self, context: bpy.types.Context):
-        if self.algorithm == "2":
-            return self.execute_2(context)
-        elif self.algorithm == "3":
-            return self.execute_3(context)
-        return self.execute_1(context)
-
 # def _util_collapse_bone(bone: bpy.types.EditBone, armature: bpy.types.Armature):
 #     if bone.parent  None:
 
 
+def find_armature_meshes(armature, objects=None) -> list:
+    # 所有通过骨架修改器绑定到该骨架的网格，不只是子级
+    if objects is None:
+        objects = bpy.context.scene.objects
+    meshes = []
+    for obj in objects:
+        if obj.type != "MESH":
+            continue
+        for modifier in obj.modifiers:
+            if modifier.type == "ARMATURE" and modifier.object == armature:
+                meshes.append(obj)
+                break
+    return meshes
+
+
+def vertex_groups_aligned(mesh, bone_lookup: dict[str, int]) -> bool:
+    # 前 len(bone_lookup) 个顶点组与骨骼一一对应，顶点组下标就是骨骼下标；bone_lookup 按骨骼下标顺序插入
+    return mesh.vertex_groups.keys()[:len(bone_lookup)] == list(bone_lookup)
+
+
+def vertex_group_bone_indices(mesh, bone_lookup: dict[str, int]) -> np.ndarray:
+    # 顶点组下标 -> 骨骼下标，不对应骨骼的顶点组为 -1
+    if vertex_groups_aligned(mesh, bone_lookup):
+        indices = np.full(len(mesh.vertex_groups), -1, dtype=np.int32)
+        indices[:len(bone_lookup)] = np.arange(len(bone_lookup))
+        return indices
+    return np.array([bone_lookup.get(name, -1) for name in mesh.vertex_groups.keys()], dtype=np.int32)
+
+
+def reorder_vertex_groups(mesh, bone_lookup: dict[str, int], pad: bool = False) -> bool:
+    # 按骨骼顺序重排已有的顶点组，不对应骨骼的顶点组排在后面；顺序没变时不做任何事
+    # pad 时没有顶点组的骨骼补一个空组，之后顶点组下标等于骨骼下标
+    # 保留权重、锁定状态和活动顶点组
+    if pad and vertex_groups_aligned(mesh, bone_lookup):
+        return False
+    vertex_groups = mesh.vertex_groups
+    bone_indices = vertex_group_bone_indices(mesh, bone_lookup)
+    old_to_new = core.weights.bone_aligned_group_remap(bone_indices, len(bone_lookup), pad)
+    if np.array_equal(old_to_new, np.arange(len(old_to_new))):
+        return False
+
+    verts, groups, weights = read_vertex_weights(mesh)
+    names = vertex_groups.keys()
+    locks = [vg.lock_weight for vg in vertex_groups]
+    active = vertex_groups.active_index
+
+    if pad:
+        new_names = list(bone_lookup) + [names[i] for i in np.flatnonzero(bone_indices < 0)]
+    else:
+        new_names = [names[i] for i in np.argsort(old_to_new)]
+    vertex_groups.clear()
+    for name in new_names:
+        vertex_groups.new(name=name)
+    write_vertex_weights(mesh, verts, old_to_new[groups], weights)
+    for i, lock in enumerate(locks):
+        vertex_groups[int(old_to_new[i])].lock_weight = lock
+    if active >= 0:
+        vertex_groups.active_index = int(old_to_new[active])
+    return True
+
+
+def remove_unweighted_bones(armature, meshes, whitelist=None, epsilon: float = 0.0, near_zero: float = 0.001):
+    # 骨架需要处于编辑模式；whitelist 为 None 时检查所有骨骼
+    edit_bones = armature.data.edit_bones
+    bone_names = edit_bones.keys()
+    bone_lookup = {name: i for i, name in enumerate(bone_names)}
+
+    # 每个网格的顶点组先映射到骨骼下标，之后都是整数下标运算
+    max_weights = np.zeros(len(bone_names), dtype=np.float32)
+    mesh_bone_indices = []
+    for mesh in meshes:
+        bone_indices = vertex_group_bone_indices(mesh, bone_lookup)
+        mesh_bone_indices.append(bone_indices)
+        _, groups, weights = read_vertex_weights(mesh)
+        groups = bone_indices[groups]
+        valid = groups >= 0
+        np.maximum(max_weights, core.weights.group_max_weights(groups[valid], weights[valid], len(bone_names)),
+                   out=max_weights)
+
+    candidates = np.ones(len(bone_names), dtype=bool)
+    if whitelist is not None:
+        candidates = np.array([name in whitelist for name in bone_names], dtype=bool)
+    removed = np.flatnonzero(candidates & (max_weights <= epsilon))
+    near_zero_bones = [bone_names[i] for i in np.flatnonzero(candidates & (max_weights > epsilon) & (max_weights < near_zero))]
+
+    to_remove = [edit_bones[bone_names[i]] for i in removed]
+    for bone in to_remove:
+        edit_bones.remove(bone)
+    if to_remove:
+        invalidate_armature_analysis(armature)
+
+    # 多出的一位给 -1（不对应骨骼的顶点组）
+    is_removed = np.zeros(len(bone_names) + 1, dtype=bool)
+    is_removed[removed] = True
+    for mesh, bone_indices in zip(meshes, mesh_bone_indices):
+        # 从后往前删，前面的下标不变
+        for i in np.flatnonzero(is_removed[bone_indices])[::-1]:
+            mesh.vertex_groups.remove(mesh.vertex_groups[int(i)])
+    return len(to_remove), near_zero_bones
+
+
 class OP_RemoveUnweightedBones(bpy.types.Operator):
     bl_idname = "nekotools.remove_unweighted_bones"
     bl_label = "清除无权重骨骼"
     bl_options = {'REGISTER', 'UNDO'}
 
     only_selected: bpy.props.BoolProperty(name="Only Selected", default=True)
+    epsilon: bpy.props.FloatProperty(name="Epsilon", description="最大权重不超过此值的顶点组视为空",
+                                     default=0.0, min=0.0, max=1.0, precision=5)
+    near_zero: bpy.props.FloatProperty(name="Near Zero", description="报告最大权重低于此值但被保留的骨骼",
+                                       default=0.001, min=0.0, max=1.0, precision=5)
 
+    @instrumented
     def execute(self, context: bpy.types.Context):
         num_deleted = 0
-        
-        for armature in context.selected_objects:
-            switch_mode("OBJECT")
-            if armature.type != "ARMATURE":
-                continue
-            vertex_group_names = {}
+        near_zero_bones = []
 
-            whitlist = {}
+        armatures = [obj for obj in context.selected_objects if obj.type == "ARMATURE"]
+        if not armatures:
+            self.report({"ERROR"}, "没有选中骨架")
+            return {'CANCELLED'}
+        if context.view_layer.objects.active not in armatures:
+            set_active_obj(armatures[0])
+
+        # 所有要读的数据先准备好，然后所有骨架一起进入一次编辑模式
+        jobs = []
+        for armature in armatures:
+            whitlist = None
+            analysis = armature_analysis(armature)
             if self.only_selected:
-                for bone in armature.data.bones:
-                    if bone.select:
-                        whitlist[bone.name] = None
-
-            for mesh in armature.children:
-                if mesh.type != "MESH":
-                    continue
-                # 检查骨架修改器
-                armature_modifier: bpy.types.ArmatureModifier = None
-                for modifier in mesh.modifiers:
-                    if modifier.type != "ARMATURE":
-                        continue
-                    if modifier.object == armature:
-                        armature_modifier = modifier
-                if armature_modifier is None:
-                    continue
-
-                with context.temp_override(selected_objects={mesh}, active_object=mesh, object=mesh):
-                    bpy.ops.lazyweight.vgroup_remove_empty()
-                    # https://extensions.blender.org/add-ons/easyweight/
-                    # bpy.ops.object.delete_empty_deform_vgroups()
-                for vg in mesh.vertex_groups:
-                    vertex_group_names[vg.name] = None
-            
-            switch_mode("EDIT")
-            for bone in armature.data.edit_bones:
-                if self.only_selected and (bone.name not in whitlist):
-                    continue
-                if bone.name not in vertex_group_names:
-                    armature.data.edit_bones.remove(bone)
-                    num_deleted += 1
-            
-        
-        self.report({"INFO"}, f"{num_deleted} bones deleted.")
+                whitlist = {analysis.bones.names[i] for i in np.flatnonzero(analysis.bones.select)}
+            jobs.append((armature, analysis.bound_meshes(armature, context.scene.objects), whitlist))
+
+        with mode_session(context.view_layer.objects.active, "EDIT"):
+            for armature, meshes, whitlist in jobs:
+                deleted, near_zero = remove_unweighted_bones(armature, meshes, whitlist, self.epsilon, self.near_zero)
+                num_deleted += deleted
+                near_zero_bones += near_zero
+
+        if near_zero_bones:
+            print("near-zero weighted bones:", ", ".join(near_zero_bones))
+            self.report({"INFO"}, f"{num_deleted} bones deleted, {len(near_zero_bones)} kept only by near-zero weights.")
+        else:
+            self.report({"INFO"}, f"{num_deleted} bones deleted.")
+        return {'FINISHED'}
+
+
+def mirror_vertex_group_map(mesh, bone_lookup: dict[str, int], mirror: str) -> np.ndarray:
+    # 源侧顶点组 -> 对侧顶点组，两侧都要有对应的骨骼，对侧顶点组不存在时新建；mirror 为 L_TO_R 或 R_TO_L
+    # 锁定的对侧顶点组不覆盖
+    vertex_groups = mesh.vertex_groups
+    source_side = "L" if mirror == "L_TO_R" else "R"
+    pairs = []
+    for name in vertex_groups.keys():
+        match = core.name_map.SIDE_PATTERN.search(name)
+        target = core.name_map.mirror_bone_name(name)
+        if match and match.group(1) == source_side and name in bone_lookup and target in bone_lookup:
+            if target in vertex_groups and vertex_groups[target].lock_weight:
+                continue
+            pairs.append((name, target))
+    for _, target in pairs:
+        if target not in vertex_groups:
+            vertex_groups.new(name=target)
+
+    mirror_group = np.full(len(vertex_groups), -1, dtype=np.int32)
+    for source, target in pairs:
+        mirror_group[vertex_groups[source].index] = vertex_groups[target].index
+    return mirror_group
+
+
+def cleanup_vertex_weights(mesh, bone_lookup: dict[str, int], max_influences: int = 4, epsilon: float = 0.0,
+                           normalize: bool = True, mirror: str = "NONE", mirror_tolerance: float = 0.0001):
+    # 只处理对应骨骼的顶点组，其他顶点组（形态键遮罩等）不受影响；锁定的顶点组和 Normalize All 一样保持不变
+    # 返回处理前后的影响数直方图：第 k 项为受 k 个骨骼影响的顶点数
+    vertex_count = len(mesh.data.vertices)
+    if mirror != "NONE":
+        mirror_group = mirror_vertex_group_map(mesh, bone_lookup, mirror)
+    is_bone = vertex_group_bone_indices(mesh, bone_lookup) >= 0
+    locked_groups = np.array([vg.lock_weight for vg in mesh.vertex_groups], dtype=bool)
+    old_rows = read_vertex_weights(mesh, np.flatnonzero(is_bone).tolist())
+    verts, groups, weights = old_rows
+    before = core.weights.influence_histogram(verts, vertex_count)
+
+    if mirror != "NONE":
+        coords = np.empty(vertex_count * 3, dtype=np.float32)
+        mesh.data.vertices.foreach_get("co", coords)
+        mirror_vertex = core.pairing.find_mirror_vertices(coords, mirror_tolerance)
+        verts, groups, weights = core.weights.mirror_weight_rows(verts, groups, weights, mirror_vertex, mirror_group)
+    verts, groups, weights = core.weights.clean_weight_rows(
+        verts, groups, weights, vertex_count, max_influences, epsilon, normalize, locked_groups)
+    after = core.weights.influence_histogram(verts, vertex_count)
+
+    # 不再保留的权重从顶点组里删掉，只写回新增和权重变化的行
+    removed, changed = core.weights.diff_weight_rows(old_rows, (verts, groups, weights), len(is_bone))
+    removed_verts, removed_groups = old_rows[0][removed], old_rows[1][removed]
+    for group in np.unique(removed_groups):
+        mesh.vertex_groups[int(group)].remove(removed_verts[removed_groups == group].tolist())
+    write_vertex_weights(mesh, verts[changed], groups[changed], weights[changed])
+    profile_count("weights removed", int(removed.sum()))
+    profile_count("weights written", int(changed.sum()))
+    return before, after
+
+
+def format_histogram(histogram) -> str:
+    return " ".join(f"{k}:{n}" for k, n in enumerate(histogram.tolist()) if n)
+
+
+class OP_CleanupWeights(bpy.types.Operator):
+    bl_idname = "nekotools.cleanup_weights"
+    bl_label = "整理权重"
+    bl_description = "选中骨架绑定的所有网格：限制每个顶点的骨骼数、删除过小的权重并归一化，可按 _L/_R 镜像权重"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    max_influences: bpy.props.IntProperty(name="Max Influences", description="每个顶点最多保留的骨骼数，Source 为 3，MMD 为 4",
+                                          default=4, min=1, max=32)
+    epsilon: bpy.props.FloatProperty(name="Epsilon", description="不超过此值的权重会被删除",
+                                     default=0.001, min=0.0, max=1.0, precision=5)
+    normalize: bpy.props.BoolProperty(name="Normalize", default=True)
+    mirror: bpy.props.EnumProperty(name="Mirror", items=[
+        ("NONE", "不镜像", ""),
+        ("L_TO_R", "L -> R", "用 _L 顶点组的权重覆盖对侧 _R 顶点组"),
+        ("R_TO_L", "R -> L", "用 _R 顶点组的权重覆盖对侧 _L 顶点组"),
+    ], default="NONE")
+    mirror_tolerance: bpy.props.FloatProperty(name="Mirror Tolerance", default=0.0001, min=0.0, precision=5)
+
+    @instrumented
+    def execute(self, context: bpy.types.Context):
+        armatures = [obj for obj in context.selected_objects if obj.type == "ARMATURE"]
+        if not armatures:
+            self.report({"ERROR"}, "没有选中骨架")
+            return {'CANCELLED'}
+
+        with phase("cleanup"):
+            lines = []
+            for armature in armatures:
+                analysis = armature_analysis(armature)
+                for mesh in analysis.bound_meshes(armature, context.scene.objects):
+                    before, after = cleanup_vertex_weights(mesh, analysis.bones.lookup, self.max_influences, self.epsilon,
+                                                           self.normalize, self.mirror, self.mirror_tolerance)
+                    lines.append(f"{mesh.name}: {format_histogram(before)} -> {format_histogram(after)}")
+
+        if not lines:
+            self.report({"WARNING"}, "没有绑定到选中骨架的网格")
+            return {'CANCELLED'}
+        print("influences per vertex (before -> after):")
+        for line in lines:
+            print("   ", line)
+        self.report({"INFO"}, f"{len(lines)} meshes cleaned. " + "; ".join(lines))
         return {'FINISHED'}
 
 
@@ -1153,6 +2226,13 @@ class MESH_MT_shape_key_context_menu_nekotools(bpy.types.Menu):
         op.options = "UNMUTE"
         op = this.layout.operator(OP_SetAllShapeKeyMuteState.bl_idname, text="反转屏蔽", icon="SELECT_DIFFERENCE")
         op.options = "INVERT"
+        this.layout.separator()
+        op = this.layout.operator(OP_AnalyzeShapeKeys.bl_idname, text="分析形态键", icon="VIEWZOOM")
+        op.action = "REPORT"
+        op = this.layout.operator(OP_AnalyzeShapeKeys.bl_idname, text="删除空形态键", icon="TRASH")
+        op.action = "REMOVE_EMPTY"
+        op = this.layout.operator(OP_AnalyzeShapeKeys.bl_idname, text="合并重复形态键", icon="AUTOMERGE_ON")
+        op.action = "MERGE_DUPLICATES"
     
     @staticmethod
     def register():
@@ -1210,6 +2290,8 @@ def draw_VIEW3D_MT_pose_context_menu(this: bpy.types.Menu, _):
 
 classes = [
     OP_MergeBones_GetThreshold,
+    OP_MergeBones_Preview,
+    OP_MergeBones_ClearPreview,
     OP_CollapseMaterialName,
     OP_CopyBodyGroup,
     OP_SeparateByMaterial,
@@ -1220,19 +2302,27 @@ classes = [
     OP_MMDBoneToVParent,
     OP_DecimateBoneChain,
     OP_RemoveUnweightedBones,
+    OP_CleanupWeights,
     OP_ValveBoneRename,
+    OP_ClearProfileLog,
     VIEW_3D_PT_nekotools,
     OP_SelectBones1,
     OP_SelectedBonesToClipboard,
     OP_SetAllShapeKeyMuteState,
+    OP_AnalyzeShapeKeys,
     VIEW3D_MT_select_pose_nekotools,
     MESH_MT_shape_key_context_menu_nekotools,
     OUTLINER_MT_collection_nekotools
 ]
 
 def register():
+    load_bone_map_presets()
     for c in classes:
         bpy.utils.register_class(c)
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_material_texture_cache)
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_analysis_cache)
+    for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post, bpy.app.handlers.load_post):
+        handlers.append(clear_analysis_cache)
 
     scene = bpy.types.Scene
     scene.keep_merged_bones = BoolProperty(
@@ -1250,6 +2340,30 @@ def register():
         precision=8,
         subtype='FACTOR'
     )
+    scene.merge_bones_by_bone_color = BoolProperty(
+        name='By Bone Color',
+        description="合并、预览和获取阈值都用骨骼颜色代替骨骼集合判断哪些骨骼是合并目标",
+        default=False
+    )
+    scene.merge_bones_preview_range = FloatProperty(
+        name='Preview Range',
+        description="预览时收集的最大骨骼距离",
+        default=0.001,
+        min=0,
+        max=10,
+        step=0.01,
+        precision=6
+    )
+    scene.profile_operators = BoolProperty(
+        name='Profile Operators',
+        description="记录每次执行的总用时、各阶段用时和计数",
+        default=False
+    )
+    scene.profile_cprofile = BoolProperty(
+        name='cProfile',
+        description="同时用 cProfile 采样，结果打印到控制台",
+        default=False
+    )
 
     bpy.types.VIEW3D_MT_armature_context_menu.append(draw_VIEW3D_MT_armature_context_menu)
     bpy.types.VIEW3D_MT_edit_armature.append(draw_VIEW3D_MT_edit_armature)
@@ -1263,6 +2377,15 @@ def unregister():
     bpy.types.VIEW3D_MT_pose.remove(draw_VIEW3D_MT_pose)
     bpy.types.VIEW3D_MT_pose_context_menu.remove(draw_VIEW3D_MT_pose_context_menu)
 
+    merge_preview_cache.clear()
+    material_texture_cache.clear()
+    analysis_cache.clear()
+    profile_log.clear()
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_material_texture_cache)
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_analysis_cache)
+    for handlers in (bpy.app.handlers.undo_post, bpy.app.handlers.redo_post, bpy.app.handlers.load_post):
+        handlers.remove(clear_analysis_cache)
+
     for c in reversed(classes):
         bpy.utils.unregister_class(c)
 
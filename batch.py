@@ -0,0 +1,255 @@
+# 批量处理 .blend 文件
+#
+# 多个文件（用进程池同时运行多个 blender 实例）:
+#   python batch.py --blender /path/to/blender --jobs 4 --steps valve_rename,merge_bones,qc \
+#       --output-dir out --summary summary.json a.blend b.blend ...
+#
+# 单个文件（在 blender 里运行）:
+#   blender -b file.blend --python batch.py -- --worker --steps merge_bones,remove_unweighted --result r.json
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ADDON_DIR = Path(__file__).resolve().parent
+# remove_unweighted 会删掉只用于约束、IK 或物理的骨骼，需要显式加进 --steps
+DEFAULT_STEPS = "valve_rename,merge_bones,separate,qc"
+
+
+def load_addon(name: str = "nekotools"):
+    import importlib.util
+
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(
+        name, ADDON_DIR / "__init__.py", submodule_search_locations=[str(ADDON_DIR)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="NekoTools batch pipeline")
+    parser.add_argument("files", nargs="*", type=Path)
+    parser.add_argument("--steps", default=DEFAULT_STEPS,
+                        help=f"逗号分隔的步骤，可选: {DEFAULT_STEPS},remove_unweighted,cleanup_weights")
+    parser.add_argument("--blender", default=os.environ.get("BLENDER", "blender"))
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output-dir", type=Path, help="处理后的 .blend 和 .qc 保存到这里")
+    parser.add_argument("--in-place", action="store_true", help="直接覆盖原文件")
+    parser.add_argument("--summary", type=Path, help="JSON 汇总输出路径，默认打印到标准输出")
+    parser.add_argument("--threshold", type=float, default=0.00001)
+    parser.add_argument("--keep-merged-bones", action="store_true")
+    parser.add_argument("--epsilon", type=float, default=0.0)
+    parser.add_argument("--keep-bones", help="remove_unweighted 不删除名字匹配这个正则的骨骼")
+    parser.add_argument("--reverse-rename", action="store_true")
+    parser.add_argument("--max-influences", type=int, default=4, help="cleanup_weights 每个顶点最多保留的骨骼数")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", type=Path, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+# ---- worker: 在 blender 进程内运行 ----
+
+def _armatures(bpy):
+    return [obj for obj in bpy.context.scene.objects if obj.type == "ARMATURE"]
+
+
+def _enter_mode(bpy, addon, obj, mode):
+    addon.switch_mode("OBJECT")
+    for other in bpy.context.view_layer.objects.selected:
+        other.select_set(False)
+    obj.select_set(True)
+    addon.set_active_obj(obj)
+    addon.switch_mode(mode)
+
+
+def step_valve_rename(bpy, addon, args, output_stem):
+    result = {}
+    for obj in _armatures(bpy):
+        renamed, unmapped = addon.valve_bone_rename(obj.data, args.reverse_rename)
+        result[obj.name] = {"renamed": renamed, "unmapped": len(unmapped)}
+    return result
+
+
+def step_merge_bones(bpy, addon, args, output_stem):
+    result = {}
+    for obj in _armatures(bpy):
+        _enter_mode(bpy, addon, obj, "EDIT")
+        merged, timings = addon.merge_bones_by_distance(
+            obj, list(obj.data.edit_bones), args.threshold, args.keep_merged_bones, merge_weight=True)
+        addon.switch_mode("OBJECT")
+        result[obj.name] = {"merged": merged, "mesh_seconds": dict(timings)}
+    return result
+
+
+def step_remove_unweighted(bpy, addon, args, output_stem):
+    result = {}
+    for obj in _armatures(bpy):
+        meshes = addon.find_armature_meshes(obj, bpy.context.scene.objects)
+        _enter_mode(bpy, addon, obj, "EDIT")
+        whitelist = None
+        if args.keep_bones:
+            keep = re.compile(args.keep_bones)
+            whitelist = {name for name in obj.data.edit_bones.keys() if not keep.search(name)}
+        deleted, near_zero = addon.remove_unweighted_bones(obj, meshes, whitelist, epsilon=args.epsilon)
+        addon.switch_mode("OBJECT")
+        result[obj.name] = {"deleted": deleted, "near_zero": near_zero}
+    return result
+
+
+def step_cleanup_weights(bpy, addon, args, output_stem):
+    result = {}
+    for obj in _armatures(bpy):
+        bone_lookup = addon.BoneData(obj).lookup
+        for mesh in addon.find_armature_meshes(obj, bpy.context.scene.objects):
+            before, after = addon.cleanup_vertex_weights(mesh, bone_lookup, args.max_influences, args.epsilon)
+            result[mesh.name] = {"before": before.tolist(), "after": after.tolist()}
+    return result
+
+
+def step_separate(bpy, addon, args, output_stem):
+    meshes = [obj for obj in bpy.context.scene.objects if obj.type == "MESH" and len(obj.data.materials) > 1]
+    return [part.name for part in addon.separate_by_material(meshes)]
+
+
+def step_qc(bpy, addon, args, output_stem):
+    meshes = [obj for obj in bpy.context.scene.objects if obj.type == "MESH"]
+    written = []
+    for suffix, chunks in (("materials", addon.iter_material_qc(meshes)),
+                           ("bodygroups", addon.iter_bodygroup_qc([obj.name for obj in meshes]))):
+        path = output_stem.with_name(f"{output_stem.name}_{suffix}.qc")
+        addon.write_qc(chunks, "FILE", filepath=str(path))
+        written.append(str(path))
+    return written
+
+
+STEPS = {
+    "valve_rename": step_valve_rename,
+    "merge_bones": step_merge_bones,
+    "remove_unweighted": step_remove_unweighted,
+    "cleanup_weights": step_cleanup_weights,
+    "separate": step_separate,
+    "qc": step_qc,
+}
+
+
+def output_path(args, source: Path) -> Path:
+    if args.output_dir:
+        return args.output_dir / source.name
+    return source
+
+
+def run_worker(args):
+    import bpy
+
+    addon = load_addon()
+    # 注册算子、场景属性和缓存失效的 handler
+    addon.register()
+    source = Path(bpy.data.filepath)
+    target = output_path(args, source)
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    report = {"file": str(source), "ok": True, "steps": []}
+    start = time.perf_counter()
+    try:
+        for name in args.steps.split(","):
+            step_start = time.perf_counter()
+            # 每一步相当于一次算子执行，步骤内复用读过的权重
+            with addon.weight_cache_scope():
+                result = STEPS[name](bpy, addon, args, target.with_suffix(""))
+            report["steps"].append({"name": name, "seconds": time.perf_counter() - step_start, "result": result})
+        if args.output_dir or args.in_place:
+            bpy.ops.wm.save_as_mainfile(filepath=str(target))
+            report["saved"] = str(target)
+    except Exception as error:
+        report["ok"] = False
+        report["error"] = f"{type(error).__name__}: {error}"
+    report["seconds"] = time.perf_counter() - start
+
+    if args.result:
+        args.result.write_text(json.dumps(report, ensure_ascii=False), encoding="utf-8")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+# ---- driver: 普通 python 进程，调度多个 blender ----
+
+def run_file(args, source: Path, forward: list[str]) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        result_path = Path(tmp) / "result.json"
+        cmd = [args.blender, "-b", "--factory-startup", str(source), "--python", str(Path(__file__).resolve()),
+               "--", "--worker", "--result", str(result_path)] + forward
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if result_path.exists():
+            report = json.loads(result_path.read_text(encoding="utf-8"))
+        else:
+            report = {"file": str(source), "ok": False,
+                      "error": f"blender exited with {proc.returncode}",
+                      "stderr": proc.stderr[-2000:]}
+        report["wall_seconds"] = time.perf_counter() - start
+        return report
+
+
+def worker_args(args) -> list[str]:
+    forward = ["--steps", args.steps, "--threshold", str(args.threshold), "--epsilon", str(args.epsilon),
+               "--max-influences", str(args.max_influences)]
+    if args.output_dir:
+        forward += ["--output-dir", str(args.output_dir.resolve())]
+    if args.in_place:
+        forward.append("--in-place")
+    if args.keep_merged_bones:
+        forward.append("--keep-merged-bones")
+    if args.reverse_rename:
+        forward.append("--reverse-rename")
+    if args.keep_bones:
+        forward += ["--keep-bones", args.keep_bones]
+    return forward
+
+
+def run_driver(args):
+    unknown = [name for name in args.steps.split(",") if name not in STEPS]
+    if unknown:
+        sys.exit(f"unknown steps: {', '.join(unknown)}")
+    if not args.files:
+        sys.exit("no input files")
+
+    forward = worker_args(args)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        reports = list(pool.map(lambda source: run_file(args, source, forward), args.files))
+
+    summary = {
+        "steps": args.steps.split(","),
+        "files": reports,
+        "failed": sum(not report["ok"] for report in reports),
+        "seconds": time.perf_counter() - start,
+    }
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary:
+        args.summary.write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+    if args.worker:
+        run_worker(args)
+    else:
+        run_driver(args)
+
+
+if __name__ == "__main__":
+    main()
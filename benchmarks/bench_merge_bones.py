@@ -0,0 +1,64 @@
+# blender -b --factory-startup --python benchmarks/bench_merge_bones.py -- [--counts 1000 5000 20000]
+import argparse
+import sys
+from decimal import Decimal
+from pathlib import Path
+
+import bpy
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common import load_addon, new_armature, reset_scene, script_args, timed  # noqa: E402
+
+
+def legacy_pairs(heads, threshold: float) -> list[tuple[int, int]]:
+    # 旧实现的两两比较
+    pairs = []
+    for i in range(len(heads)):
+        for i2 in range(i + 1, len(heads)):
+            d = heads[i] - heads[i2]
+            if Decimal(d.length) <= Decimal(threshold):
+                pairs.append((i, i2))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--threshold", type=float, default=0.00001)
+    parser.add_argument("--legacy-max", type=int, default=5000,
+                        help="超过这个骨骼数量时不运行旧实现，按 O(n²) 从实测的最大规模外推")
+    args = parser.parse_args(script_args())
+
+    addon = load_addon()
+    print(f"{'bones':>8} {'pairs':>8} {'grid':>10} {'legacy':>10} {'speedup':>8}")
+    measured = None
+    for count in sorted(args.counts):
+        reset_scene()
+        obj = new_armature("BenchArmature", count)
+        bpy.ops.object.mode_set(mode="EDIT")
+        heads = [bone.head.copy() for bone in obj.data.edit_bones]
+
+        t_new, pairs = timed(addon.find_bone_pairs_by_distance, heads, args.threshold)
+        if count <= args.legacy_max:
+            t_old, old_pairs = timed(legacy_pairs, heads, args.threshold)
+            if old_pairs != pairs:
+                print(f"  MISMATCH: {len(old_pairs)} legacy pairs vs {len(pairs)}")
+            measured = (count, t_old)
+            legacy = f"{t_old:10.3f}"
+            speedup = f"{t_old / max(t_new, 1e-9):7.1f}x"
+        elif measured is not None:
+            # 旧实现是两两比较，用时按骨骼数的平方增长
+            t_old = measured[1] * (count / measured[0]) ** 2
+            legacy = f"~{t_old:9.3f}"
+            speedup = f"~{t_old / max(t_new, 1e-9):6.1f}x"
+        else:
+            legacy = f"{'skipped':>10}"
+            speedup = f"{'-':>8}"
+        print(f"{count:8d} {len(pairs):8d} {t_new:10.3f} {legacy} {speedup}")
+        bpy.ops.object.mode_set(mode="OBJECT")
+    if measured is not None and max(args.counts) > args.legacy_max:
+        print(f"~ 旧实现没有运行，按 O(n²) 从 {measured[0]} 根骨骼的实测用时外推")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# blender -b --factory-startup --python benchmarks/bench_separate_by_material.py -- [--loops 100000 1000000]
+import argparse
+import sys
+from pathlib import Path
+
+import bpy
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common import load_addon, new_multi_material_mesh, reset_scene, script_args, timed  # noqa: E402
+
+
+def part_coords(objects) -> list[np.ndarray]:
+    result = []
+    for obj in objects:
+        co = np.empty(len(obj.data.vertices) * 3, dtype=np.float32)
+        obj.data.vertices.foreach_get("co", co)
+        result.append(co)
+    return result
+
+
+def run(addon, engine: str, loops: int, materials: int):
+    reset_scene()
+    obj = new_multi_material_mesh("BenchMesh", loops, materials)
+    bpy.ops.object.mode_set(mode="OBJECT")
+    seconds, parts = timed(addon.separate_by_material, [obj], engine)
+    # 以材质名排序后比较，两种方式的物体创建顺序可能不同
+    parts = sorted(parts, key=lambda part: part.data.materials[0].name)
+    return seconds, part_coords(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--loops", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--materials", type=int, default=8)
+    args = parser.parse_args(script_args())
+
+    addon = load_addon()
+    print(f"{'loops':>9} {'edit':>10} {'numpy':>10} {'speedup':>8} same")
+    for loops in args.loops:
+        t_edit, edit_parts = run(addon, "EDIT", loops, args.materials)
+        t_numpy, numpy_parts = run(addon, "NUMPY", loops, args.materials)
+        same = len(edit_parts) == len(numpy_parts) and all(
+            np.array_equal(a, b) for a, b in zip(edit_parts, numpy_parts))
+        print(f"{loops:9d} {t_edit:10.3f} {t_numpy:10.3f} {t_edit / max(t_numpy, 1e-9):7.1f}x {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# 在 blender -b 下运行的基准测试公用部分
+import importlib.util
+import sys
+import time
+from pathlib import Path
+
+import bpy
+import numpy as np
+
+ADDON_DIR = Path(__file__).resolve().parent.parent
+
+
+def load_addon(name: str = "nekotools"):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(
+        name, ADDON_DIR / "__init__.py", submodule_search_locations=[str(ADDON_DIR)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def script_args() -> list[str]:
+    argv = sys.argv
+    return argv[argv.index("--") + 1:] if "--" in argv else []
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def reset_scene():
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+
+
+def new_armature(name: str, bone_count: int, helper_ratio: float = 0.1, seed: int = 0) -> bpy.types.Object:
+    # 一部分骨骼放进骨骼集合，另一部分作为与其重合、不在集合里的辅助骨
+    rng = np.random.default_rng(seed)
+    helper_count = int(bone_count * helper_ratio)
+    deform_count = bone_count - helper_count
+
+    heads = rng.uniform(-1.0, 1.0, (deform_count, 3))
+    helper_heads = heads[rng.integers(0, deform_count, helper_count)]
+    helper_heads = helper_heads + rng.uniform(-1e-7, 1e-7, helper_heads.shape)
+
+    data = bpy.data.armatures.new(name)
+    obj = bpy.data.objects.new(name, data)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    collection = data.collections.new("Deform")
+
+    bpy.ops.object.mode_set(mode="EDIT")
+    for i, head in enumerate(heads):
+        bone = data.edit_bones.new(f"Bone_{i}")
+        bone.head = head
+        bone.tail = head + (0.0, 0.0, 0.05)
+        collection.assign(bone)
+    for i, head in enumerate(helper_heads):
+        bone = data.edit_bones.new(f"Helper_{i}")
+        bone.head = head
+        bone.tail = head + (0.0, 0.02, 0.05)
+    bpy.ops.object.mode_set(mode="OBJECT")
+    return obj
+
+
+def new_multi_material_mesh(name: str, loop_count: int, material_count: int = 8, seed: int = 0) -> bpy.types.Object:
+    # 四边形网格，按随机的条带分配材质，带 UV、两个形态键和几个顶点组
+    rng = np.random.default_rng(seed)
+    size = max(int((loop_count / 4) ** 0.5), 1)
+    bpy.ops.mesh.primitive_grid_add(x_subdivisions=size + 1, y_subdivisions=size + 1, size=2.0)
+    obj = bpy.context.active_object
+    obj.name = name
+    mesh = obj.data
+
+    for i in range(material_count):
+        mesh.materials.append(bpy.data.materials.new(f"{name}_mat{i}"))
+    stripes = rng.integers(0, material_count, size)
+    material_index = np.repeat(stripes, len(mesh.polygons) // size + 1)[:len(mesh.polygons)]
+    mesh.polygons.foreach_set("material_index", material_index.astype(np.int32))
+
+    for i in range(4):
+        vg = obj.vertex_groups.new(name=f"Bone_{i}")
+        indices = np.flatnonzero(rng.random(len(mesh.vertices)) < 0.5)
+        vg.add(indices.tolist(), 0.5, 'REPLACE')
+
+    obj.shape_key_add(name="Basis", from_mix=False)
+    key = obj.shape_key_add(name="Offset", from_mix=False)
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    key.data.foreach_get("co", co)
+    key.data.foreach_set("co", co + rng.uniform(-0.01, 0.01, co.shape).astype(np.float32))
+    return obj
+
+
+def new_weighted_mesh(name: str, armature: bpy.types.Object, vertex_count: int, group_count: int,
+                      influences: int = 4, seed: int = 0) -> bpy.types.Object:
+    # 网格顶点组以骨架的前 group_count 根骨骼命名，每个顶点随机分到 influences 个顶点组
+    # 权重量化到 0.05，按 (组, 权重) 批量 add
+    rng = np.random.default_rng(seed)
+    size = max(int(vertex_count ** 0.5), 2)
+    bpy.ops.mesh.primitive_grid_add(x_subdivisions=size, y_subdivisions=size, size=2.0)
+    obj = bpy.context.active_object
+    obj.name = name
+
+    bone_names = armature.data.bones.keys()[:group_count]
+    for bone_name in bone_names:
+        obj.vertex_groups.new(name=bone_name)
+
+    count = len(obj.data.vertices)
+    verts = np.repeat(np.arange(count), influences)
+    groups = rng.integers(0, len(bone_names), len(verts))
+    weights = np.round(rng.uniform(0.05, 1.0, len(verts)) * 20) / 20
+    keys = np.unique(np.stack([groups, np.rint(weights * 20), verts], axis=1).astype(np.int64), axis=0)
+    breaks = np.flatnonzero(np.any(keys[1:, :2] != keys[:-1, :2], axis=1)) + 1
+    for rows in np.split(keys, breaks):
+        if len(rows):
+            vg = obj.vertex_groups[int(rows[0, 0])]
+            vg.add(rows[:, 2].tolist(), rows[0, 1] / 20, 'REPLACE')
+
+    obj.parent = armature
+    modifier = obj.modifiers.new("Armature", "ARMATURE")
+    modifier.object = armature
+    return obj
+
+
+def new_bone_chains(name: str, chain_count: int, chain_length: int, seed: int = 0) -> bpy.types.Object:
+    # 一根根骨下挂 chain_count 条相连的波浪形骨骼链，类似头发/裙子
+    rng = np.random.default_rng(seed)
+    data = bpy.data.armatures.new(name)
+    obj = bpy.data.objects.new(name, data)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+
+    bpy.ops.object.mode_set(mode="EDIT")
+    root = data.edit_bones.new("Root")
+    root.head = (0.0, 0.0, 0.0)
+    root.tail = (0.0, 0.0, 0.1)
+    for c in range(chain_count):
+        angle = 2.0 * np.pi * c / chain_count
+        direction = np.array([np.cos(angle), np.sin(angle), 0.0])
+        phase = rng.uniform(0.0, 2.0 * np.pi)
+        parent = root
+        for i in range(chain_length + 1):
+            t = i / chain_length
+            point = direction * (0.2 + 0.5 * t) + (0.0, 0.0, -t + 0.02 * np.sin(phase + 12.0 * t))
+            if i == 0:
+                head = point
+                continue
+            bone = data.edit_bones.new(f"Chain_{c}_{i - 1}")
+            bone.head = head
+            bone.tail = point
+            bone.parent = parent
+            bone.use_connect = parent is not root
+            parent, head = bone, point
+    bpy.ops.object.mode_set(mode="OBJECT")
+    return obj
@@ -0,0 +1,216 @@
+# 所有基准测试，在 blender -b 下运行，不需要显示器和 GPU
+#   blender -b --factory-startup --python benchmarks/run.py -- --output report.json
+#   blender -b --factory-startup --python benchmarks/run.py -- --cases merge_bones,decimate_rdp --scale 0.2 \
+#       --baseline baseline.json --fail-on-regression
+#
+# 每个用例先生成固定随机种子的测试数据（不计时），然后计时调用算子或函数。
+# 用例运行在 profiling() 记录里，算子内部 phase() / profile_count() 的结果也一起写进报告。
+import argparse
+import json
+import statistics
+import sys
+from pathlib import Path
+
+import bpy
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from common import (load_addon, new_armature, new_bone_chains, new_multi_material_mesh,  # noqa: E402
+                    new_weighted_mesh, reset_scene, script_args)
+
+
+def edit_all_bones(armature: bpy.types.Object, select: bool = True):
+    bpy.context.view_layer.objects.active = armature
+    armature.select_set(True)
+    bpy.ops.object.mode_set(mode="EDIT")
+    edit_bones = armature.data.edit_bones
+    state = np.full(len(edit_bones), select, dtype=bool)
+    for attr in ("select", "select_head", "select_tail"):
+        edit_bones.foreach_set(attr, state)
+
+
+def case_merge_bones(addon, scale: float):
+    params = {"bones": int(2000 * scale), "vertices": int(100000 * scale)}
+    armature = new_armature("Rig", params["bones"], helper_ratio=0.1)
+    new_weighted_mesh("Body", armature, params["vertices"], params["bones"])
+    edit_all_bones(armature)
+    return params, lambda: bpy.ops.sourcecat.merge_bones(merge_weight=True)
+
+
+def case_merge_weights(addon, scale: float):
+    params = {"groups": max(int(400 * scale), 2), "vertices": int(200000 * scale)}
+    armature = new_armature("Rig", params["groups"], helper_ratio=0.0)
+    mesh = new_weighted_mesh("Body", armature, params["vertices"], params["groups"])
+    names = mesh.vertex_groups.keys()
+    half = len(names) // 2
+    mapping = dict(zip(names[:half], names[half:]))
+    return params, lambda: addon.merge_vertex_groups_multi([mesh], mapping)
+
+
+def case_remove_unweighted(addon, scale: float):
+    params = {"bones": int(2000 * scale), "vertices": int(100000 * scale)}
+    armature = new_armature("Rig", params["bones"], helper_ratio=0.5)
+    new_weighted_mesh("Body", armature, params["vertices"], params["bones"] // 2)
+    bpy.context.view_layer.objects.active = armature
+    armature.select_set(True)
+    return params, lambda: bpy.ops.nekotools.remove_unweighted_bones(only_selected=False)
+
+
+    # 骨骼数据和绑定网格来自 analysis_cache；权重只在一次 execute 内缓存，每次调用都重新读
+    # 没有选中骨骼时不会删除任何骨骼，但仍然读取所有绑定网格的权重；预热一次后计时同样的调用
+    # 骨骼数据、绑定网格和权重都来自 analysis_cache
+    params, _ = case_remove_unweighted(addon, scale)
+    armature = bpy.context.view_layer.objects.active
+    armature.data.bones.foreach_set("select", np.zeros(len(armature.data.bones), dtype=bool))
+    bpy.ops.nekotools.remove_unweighted_bones(only_selected=True)
+    return params, lambda: bpy.ops.nekotools.remove_unweighted_bones(only_selected=True)
+
+
+def case_cleanup_weights(addon, scale: float):
+    params = {"bones": int(1000 * scale), "vertices": int(200000 * scale), "influences": 8}
+    armature = new_armature("Rig", params["bones"], helper_ratio=0.0)
+    new_weighted_mesh("Body", armature, params["vertices"], params["bones"], influences=params["influences"])
+    bpy.context.view_layer.objects.active = armature
+    armature.select_set(True)
+    return params, lambda: bpy.ops.nekotools.cleanup_weights(max_influences=4, epsilon=0.01)
+
+
+def separate_case(engine: str):
+    def case(addon, scale: float):
+        params = {"loops": int(400000 * scale), "materials": 8, "engine": engine}
+        new_multi_material_mesh("Body", params["loops"], params["materials"])
+        return params, lambda: bpy.ops.sourcecat.separate_by_material(engine=engine)
+    return case
+
+
+def decimate_case(algorithm: str):
+    def case(addon, scale: float):
+        params = {"chains": max(int(500 * scale), 1), "length": 20, "algorithm": algorithm}
+        armature = new_bone_chains("Hair", params["chains"], params["length"])
+        edit_all_bones(armature)
+        armature.data.edit_bones["Root"].select = False
+        return params, lambda: bpy.ops.nekotools.decimate_bone_chain(algorithm=algorithm, iterations=1, ratio=0.5)
+    return case
+
+
+def case_select_bones1(addon, scale: float):
+    params = {"chains": max(int(500 * scale), 1), "length": 20}
+    armature = new_bone_chains("Skirt", params["chains"], params["length"])
+    edit_all_bones(armature, select=False)
+    active = armature.data.edit_bones["Chain_0_10"]
+    active.select = True
+    armature.data.edit_bones.active = active
+    return params, lambda: bpy.ops.nekotools.select_bones1(same_prefix=True)
+
+
+def case_select_bones1_warm(addon, scale: float):
+    # 只改选择，不改骨骼；第二次调用的骨骼链索引来自 analysis_cache
+    params, call = case_select_bones1(addon, scale)
+    call()
+    return params, call
+
+
+CASES = {
+    "merge_bones": case_merge_bones,
+    "merge_weights": case_merge_weights,
+    "remove_unweighted": case_remove_unweighted,
+    "remove_unweighted_warm": case_remove_unweighted_warm,
+    "cleanup_weights": case_cleanup_weights,
+    "separate_edit": separate_case("EDIT"),
+    "separate_numpy": separate_case("NUMPY"),
+    "decimate_rdp": decimate_case("1"),
+    "decimate_every_other": decimate_case("2"),
+    "decimate_curvature": decimate_case("4"),
+    "select_bones1": case_select_bones1,
+    "select_bones1_warm": case_select_bones1_warm,
+}
+
+
+def run_case(addon, name: str, scale: float, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        reset_scene()
+        params, call = CASES[name](addon, scale)
+        with addon.profiling(name) as record:
+            call()
+        runs.append(record)
+
+    seconds = [record["seconds"] for record in runs]
+    median = sorted(runs, key=lambda record: record["seconds"])[len(runs) // 2]
+    return {
+        "params": params,
+        "seconds": statistics.median(seconds),
+        "runs": seconds,
+        "phases": median["phases"],
+        "counters": median["counters"],
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> dict:
+    # 用时比基线慢/快超过 tolerance 的用例标记为 slower/faster，参数不同的不比较
+    result = {}
+    for name, case in report["cases"].items():
+        old = baseline.get("cases", {}).get(name)
+        if old is None:
+            result[name] = {"status": "new"}
+            continue
+        if old["params"] != case["params"]:
+            result[name] = {"status": "params changed"}
+            continue
+        ratio = case["seconds"] / max(old["seconds"], 1e-9)
+        status = "slower" if ratio > 1.0 + tolerance else "faster" if ratio < 1.0 - tolerance else "same"
+        result[name] = {"status": status, "ratio": ratio, "baseline": old["seconds"]}
+    return result
+
+
+def print_report(report: dict):
+    comparison = report.get("comparison", {})
+    print(f"{'case':<22} {'seconds':>10} {'baseline':>10} {'ratio':>7}  status")
+    for name, case in report["cases"].items():
+        diff = comparison.get(name, {})
+        baseline = f"{diff['baseline']:10.3f}" if "baseline" in diff else f"{'-':>10}"
+        ratio = f"{diff['ratio']:6.2f}x" if "ratio" in diff else f"{'-':>7}"
+        print(f"{name:<22} {case['seconds']:10.3f} {baseline} {ratio}  {diff.get('status', '')}")
+        for phase, elapsed in sorted(case["phases"].items(), key=lambda item: item[1], reverse=True):
+            print(f"    {phase:<18} {elapsed:10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", default=",".join(CASES), help=f"逗号分隔，可选: {', '.join(CASES)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="数据规模倍数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, help="JSON 报告输出路径")
+    parser.add_argument("--baseline", type=Path, help="与之前保存的 JSON 报告比较")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(script_args())
+
+    names = args.cases.split(",")
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        sys.exit(f"unknown cases: {', '.join(unknown)}")
+
+    addon = load_addon()
+    addon.register()
+
+    report = {
+        "blender": bpy.app.version_string,
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "cases": {name: run_case(addon, name, args.scale, max(args.repeat, 1)) for name in names},
+    }
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        report["comparison"] = compare(report, baseline, args.tolerance)
+
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.fail_on_regression and any(diff["status"] == "slower" for diff in report.get("comparison", {}).values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+# 不依赖 bpy 的算法部分，输入输出都是 NumPy 数组或普通 Python 数据，可以在 blender 外直接导入
+# 子模块在第一次访问 core.<name> 时才导入
+import importlib
+
+__all__ = ["cache", "chains", "decimate", "name_map", "pairing", "qc", "unionfind", "weights"]
+
+
+def __getattr__(name):
+    if name in __all__:
+        module = importlib.import_module(f".{name}", __name__)
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,70 @@
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+
+def estimate_size(value) -> int:
+    # 数组按 nbytes，容器和普通对象递归累加；只用于内存预算，不需要精确
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if hasattr(value, "__dict__"):
+        return sys.getsizeof(value) + estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    # 总大小超过 budget 字节时淘汰最久没用的条目，单个超过预算的值不缓存
+    # 值在缓存里变大后重新 put 一次，大小会重新估算
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def keys(self) -> list:
+        return list(self.entries)
+
+    def get(self, key, default=None):
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key, value, size: int | None = None):
+        self.pop(key)
+        size = estimate_size(value) if size is None else size
+        if size > self.budget:
+            return value
+        self.entries[key] = value
+        self.sizes[key] = size
+        self.size += size
+        while self.size > self.budget:
+            old, _ = self.entries.popitem(last=False)
+            self.size -= self.sizes.pop(old)
+        return value
+
+    def pop(self, key, default=None):
+        if key not in self.entries:
+            return default
+        self.size -= self.sizes.pop(key)
+        return self.entries.pop(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.sizes.clear()
+        self.size = 0
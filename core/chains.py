@@ -0,0 +1,94 @@
+import numpy as np
+
+BONE_PREFIX_SEPARATORS = ".-_ "
+
+
+def bone_name_prefix(name: str) -> str:
+    # 与 select_similar(type="PREFIX") 一致：从第二个字符开始找第一个分隔符，前缀包含分隔符，没有分隔符则为空
+    for i in range(1, len(name)):
+        if name[i] in BONE_PREFIX_SEPARATORS:
+            return name[:i + 1]
+    return ""
+
+
+class BoneChainIndex:
+    # 骨骼链索引，遍历一次骨骼后，父子/链/深度查询都是数组读取
+    # 链 = 从链首沿第一个子级一直走到底，不是父级第一个子级的骨骼开始一条新链
+    # 只保存名字和下标，bones / edit_bones / pose.bones 都可以用 names 对应回去
+    def __init__(self, names: list[str], parent):
+        # parent[i] 为父级下标，没有父级为 -1
+        self.names = list(names)
+        self.lookup = {name: i for i, name in enumerate(self.names)}
+        self._prefix_index = None
+        count = len(self.names)
+        self.parent = np.asarray(parent, dtype=np.int32).reshape(count)
+
+        # 子级按骨骼顺序排列，children(i) = child_list[child_offsets[i]:child_offsets[i + 1]]
+        has_parent = self.parent >= 0
+        self.child_count = np.bincount(self.parent[has_parent], minlength=count)
+        self.child_offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(self.child_count, out=self.child_offsets[1:])
+        order = np.argsort(self.parent, kind="stable")
+        self.child_list = order[count - int(has_parent.sum()):].astype(np.int32)
+
+        first_child = np.full(count, -1, dtype=np.int32)
+        parents = np.flatnonzero(self.child_count)
+        first_child[parents] = self.child_list[self.child_offsets[parents]]
+        self.first_child = first_child
+
+        # 链和层级深度都从链首/根出发迭代展开，不递归
+        self.chain = np.full(count, -1, dtype=np.int32)
+        self.position = np.zeros(count, dtype=np.int32)
+        self.depth = np.zeros(count, dtype=np.int32)
+        self.root = np.arange(count, dtype=np.int32)
+        self.chains = []
+        starts = ~has_parent
+        starts[has_parent] = first_child[self.parent[has_parent]] != np.flatnonzero(has_parent)
+        for start in np.flatnonzero(starts):
+            members = [start]
+            while first_child[members[-1]] >= 0:
+                members.append(first_child[members[-1]])
+            members = np.array(members, dtype=np.int32)
+            self.chain[members] = len(self.chains)
+            self.position[members] = np.arange(len(members))
+            self.chains.append(members)
+
+        level = np.flatnonzero(~has_parent)
+        while len(level):
+            children = np.concatenate([self.children(i) for i in level])
+            self.depth[children] = self.depth[self.parent[children]] + 1
+            self.root[children] = self.root[self.parent[children]]
+            level = children
+
+    @classmethod
+    def from_bones(cls, bones):
+        # 任何有 name / parent 属性的骨骼序列
+        bones = list(bones)
+        lookup = {bone.name: i for i, bone in enumerate(bones)}
+        parent = [-1 if bone.parent is None else lookup[bone.parent.name] for bone in bones]
+        return cls([bone.name for bone in bones], parent)
+
+    def __len__(self):
+        return len(self.names)
+
+    def children(self, i: int) -> np.ndarray:
+        return self.child_list[self.child_offsets[i]:self.child_offsets[i + 1]]
+
+    def chain_from(self, i: int) -> np.ndarray:
+        # i 以及它沿第一个子级往下的所有骨骼
+        return self.chains[self.chain[i]][self.position[i]:]
+
+    def with_prefix(self, prefix: str) -> np.ndarray:
+        # 前缀 -> 骨骼下标，第一次查询时建立
+        if self._prefix_index is None:
+            groups = {}
+            for i, name in enumerate(self.names):
+                groups.setdefault(bone_name_prefix(name), []).append(i)
+            self._prefix_index = {key: np.array(members, dtype=np.int32) for key, members in groups.items()}
+        return self._prefix_index.get(prefix, np.zeros(0, dtype=np.int32))
+
+    def descend(self, i: int, steps: int) -> int:
+        # 沿第一个子级往下走 steps 步，走不到返回 -1
+        members = self.chains[self.chain[i]]
+        position = self.position[i] + steps
+        return int(members[position]) if position < len(members) else -1
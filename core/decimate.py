@@ -0,0 +1,76 @@
+import numpy as np
+
+
+def decimate_every_other(count: int, iterations: int) -> np.ndarray:
+    # 每次迭代隔一个删一个，保留根
+    kept = np.arange(count)
+    for _ in range(iterations):
+        kept = kept[::2]
+    return kept
+
+
+def decimate_unsubdivide(count: int, iterations: int) -> np.ndarray:
+    # 与 bmesh.ops.unsubdivide 在折线上的效果一致：隔一个删一个，两端保留
+    kept = np.arange(count)
+    for _ in range(iterations):
+        if len(kept) < 3:
+            break
+        last = kept[-1]
+        kept = kept[::2]
+        if kept[-1] != last:
+            kept = np.append(kept, last)
+    return kept
+
+
+def rdp_importance(points: np.ndarray) -> np.ndarray:
+    # Ramer–Douglas–Peucker 分割时每个点的偏离距离，子段不超过父段，端点为 inf
+    importance = np.zeros(len(points))
+    importance[[0, -1]] = np.inf
+    stack = [(0, len(points) - 1, np.inf)]
+    while stack:
+        first, last, limit = stack.pop()
+        if last - first < 2:
+            continue
+        segment = points[last] - points[first]
+        offsets = points[first + 1:last] - points[first]
+        length2 = segment @ segment
+        if length2 > 0.0:
+            t = np.clip(offsets @ segment / length2, 0.0, 1.0)
+            distances = np.linalg.norm(offsets - t[:, None] * segment, axis=1)
+        else:
+            distances = np.linalg.norm(offsets, axis=1)
+        split = first + 1 + int(np.argmax(distances))
+        importance[split] = min(distances[split - first - 1], limit)
+        stack.append((first, split, importance[split]))
+        stack.append((split, last, importance[split]))
+    return importance
+
+
+def curvature_importance(points: np.ndarray) -> np.ndarray:
+    # 每个内部点的转角，端点为 inf
+    importance = np.full(len(points), np.inf)
+    if len(points) > 2:
+        before = points[1:-1] - points[:-2]
+        after = points[2:] - points[1:-1]
+        lengths = np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1)
+        cos = np.einsum("ij,ij->i", before, after) / np.maximum(lengths, 1e-12)
+        importance[1:-1] = np.arccos(np.clip(cos, -1.0, 1.0))
+    return importance
+
+
+def keep_most_important(importance: np.ndarray, ratio: float) -> np.ndarray:
+    keep_count = min(len(importance), max(2, int(round(len(importance) * ratio))))
+    return np.sort(np.argsort(-importance, kind="stable")[:keep_count])
+
+
+def decimate_chain(points: np.ndarray, algorithm: str, iterations: int = 1, ratio: float = 0.5):
+    # 返回 (保留的链内位置, 新头部位置或 None)
+    # "3" 与原来的 unsubdivide 一致：前面的骨骼移到保留的点上，多出的骨骼从链尾删除
+    if algorithm == "1":
+        return keep_most_important(rdp_importance(points), ratio), None
+    if algorithm == "3":
+        heads = points[decimate_unsubdivide(len(points), iterations)]
+        return np.arange(len(heads)), heads
+    if algorithm == "4":
+        return keep_most_important(curvature_importance(points), ratio), None
+    return decimate_every_other(len(points), iterations), None
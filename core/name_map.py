@@ -0,0 +1,47 @@
+import json
+import re
+from pathlib import Path
+
+SECTIONS = ("rename", "copy_location", "snap", "parent")
+
+
+def parse_bone_map(data: dict, default_name: str) -> dict:
+    # {"name": 显示名, "rename"/"copy_location"/"snap"/"parent": [(a, b), ...]}
+    preset = {"name": data.get("name", default_name)}
+    for section in SECTIONS:
+        preset[section] = [tuple(pair) for pair in data.get(section, [])]
+    return preset
+
+
+def load_bone_maps(directories, on_error=None) -> dict:
+    # 后面目录里的同名预设覆盖前面的；读取失败的文件交给 on_error(path, error)
+    presets = {}
+    for directory in directories:
+        for path in sorted(Path(directory).glob("*.json")):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                if on_error is not None:
+                    on_error(path, e)
+                continue
+            presets[path.stem] = parse_bone_map(data, path.stem)
+    return presets
+
+
+def plan_renames(names, pairs, reverse: bool = False) -> tuple[list[tuple[str, str]], list[str]]:
+    # 按映射表顺序得到 (原名, 新名)，只包括存在的骨骼；另外返回没有出现在映射表里的骨骼
+    if reverse:
+        pairs = [(new_name, name) for name, new_name in pairs]
+    existing = set(names)
+    renames = [(name, new_name) for name, new_name in pairs if name in existing]
+    mapped = {name for pair in pairs for name in pair}
+    unmapped = [name for name in names if name not in mapped]
+    return renames, unmapped
+
+
+SIDE_PATTERN = re.compile(r"(?<=_)([LR])(?=_|\.|$)")
+
+
+def mirror_bone_name(name: str) -> str:
+    # ValveBiped.Bip01_L_Thigh <-> ValveBiped.Bip01_R_Thigh，V_Thigh_L <-> V_Thigh_R；没有左右标记时原样返回
+    return SIDE_PATTERN.sub(lambda match: "R" if match.group(1) == "L" else "L", name)
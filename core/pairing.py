@@ -0,0 +1,125 @@
+import hashlib
+
+import numpy as np
+
+# 正半边的 13 个相邻格子加上自身，每对相邻格子只比较一次
+FORWARD_OFFSETS = np.array([(dx, dy, dz)
+                            for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+                            if (dx, dy, dz) >= (0, 0, 0)], dtype=np.int64)
+
+
+def cell_encoder(coords: np.ndarray):
+    # 每个轴先压缩成出现过的格子坐标的下标，组合键不会溢出；不存在的格子编码为 -1
+    axes = [np.unique(coords[:, axis]) for axis in range(3)]
+
+    def encode(cells: np.ndarray) -> np.ndarray:
+        keys = np.zeros(len(cells), dtype=np.int64)
+        valid = np.ones(len(cells), dtype=bool)
+        for axis, values in enumerate(axes):
+            index = np.minimum(np.searchsorted(values, cells[:, axis]), len(values) - 1)
+            valid &= values[index] == cells[:, axis]
+            keys = keys * len(values) + index
+        return np.where(valid, keys, -1)
+    return encode
+
+
+# 每次最多展开这么多个候选对再按距离过滤，所有点落在同一个格子里时内存也有上限
+PAIR_CHUNK_SIZE = 1 << 20
+
+
+def find_pairs_by_distance(points, threshold: float, chunk_size: int = PAIR_CHUNK_SIZE) -> np.ndarray:
+    # 均匀网格哈希，格子边长为阈值，只比较相邻格子里的点
+    # 返回所有距离不超过阈值的 (i, j)，i < j，按 (i, j) 排序，形状 (k, 2)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if len(points) < 2:
+        return np.zeros((0, 2), dtype=np.int64)
+
+    cell = threshold if threshold > 0.0 else 1.0
+    coords = np.floor((points - points.min(axis=0)) / cell).astype(np.int64)
+    encode = cell_encoder(coords)
+    keys = encode(coords)
+
+    order = np.argsort(keys, kind="stable")
+    cell_keys, cell_starts, cell_counts = np.unique(keys[order], return_index=True, return_counts=True)
+    cell_coords = coords[order[cell_starts]]
+
+    found = []
+    for offset in FORWARD_OFFSETS:
+        neighbor = encode(cell_coords + offset)
+        position = np.minimum(np.searchsorted(cell_keys, neighbor), len(cell_keys) - 1)
+        exists = (neighbor >= 0) & (cell_keys[position] == neighbor)
+        a_cells = np.flatnonzero(exists)
+        b_cells = position[exists]
+
+        # 两个格子里的点两两组合，第 k 个组合属于 ends 里第一个大于 k 的格子对
+        sizes = cell_counts[a_cells] * cell_counts[b_cells]
+        ends = np.cumsum(sizes)
+        total = int(ends[-1]) if len(ends) else 0
+        for chunk_start in range(0, total, chunk_size):
+            k = np.arange(chunk_start, min(chunk_start + chunk_size, total))
+            owner = np.searchsorted(ends, k, side="right")
+            local = k - (ends - sizes)[owner]
+            b_count = cell_counts[b_cells][owner]
+            a = order[cell_starts[a_cells][owner] + local // b_count]
+            b = order[cell_starts[b_cells][owner] + local % b_count]
+            keep = np.linalg.norm(points[a] - points[b], axis=1) <= threshold
+            if not offset.any():
+                keep &= a < b
+            a, b = a[keep], b[keep]
+            found.append(np.stack([np.minimum(a, b), np.maximum(a, b)], axis=1))
+
+    if not found:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.concatenate(found)
+    return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+
+def merge_key(names, heads, in_group) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\0".join(names).encode())
+    digest.update(np.asarray(heads, dtype=np.float32).tobytes())
+    digest.update(np.asarray(in_group, dtype=bool).tobytes())
+    return digest.hexdigest()
+
+
+def build_candidates(names, heads, in_group, radius: float) -> dict:
+    # 预览范围内所有可能合并的骨骼对，按距离排序，调整阈值时只需二分查找
+    heads = np.asarray(heads, dtype=np.float64).reshape(-1, 3)
+    grouped = np.asarray(in_group, dtype=bool)
+    pairs = find_pairs_by_distance(heads, radius)
+    pairs = pairs[~(grouped[pairs[:, 0]] & grouped[pairs[:, 1]])]
+    distances = np.linalg.norm(heads[pairs[:, 0]] - heads[pairs[:, 1]], axis=1)
+    order = np.argsort(distances, kind="stable")
+    return {
+        "key": merge_key(names, heads.astype(np.float32), in_group),
+        "radius": radius,
+        "in_group": list(in_group),
+        "heads": heads,
+        "pairs": pairs.astype(np.int32)[order],
+        "distances": distances[order],
+    }
+
+
+def pairs_within(candidates: dict, threshold: float) -> list[tuple[int, int]]:
+    count = np.searchsorted(candidates["distances"], threshold, side="right")
+    return sorted(map(tuple, candidates["pairs"][:count].tolist()))
+
+
+def find_mirror_vertices(coords, tolerance: float, axis: int = 0) -> np.ndarray:
+    # 每个顶点在 axis 轴对侧最近的顶点（距离不超过 tolerance），找不到为 -1
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 3)
+    count = len(coords)
+    mirrored = coords.copy()
+    mirrored[:, axis] *= -1.0
+
+    pairs = find_pairs_by_distance(np.concatenate([coords, mirrored]), tolerance)
+    pairs = pairs[(pairs[:, 0] < count) & (pairs[:, 1] >= count)]
+    source, target = pairs[:, 0], pairs[:, 1] - count
+    distances = np.linalg.norm(coords[source] - mirrored[target], axis=1)
+
+    order = np.lexsort((distances, source))
+    source, target = source[order], target[order]
+    first = np.concatenate(([True], source[1:] != source[:-1])) if len(source) else np.zeros(0, dtype=bool)
+    mirror = np.full(count, -1, dtype=np.int64)
+    mirror[source[first]] = target[first]
+    return mirror
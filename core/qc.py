@@ -0,0 +1,15 @@
+def iter_material_qc(textures: dict[str, str]):
+    # textures: 材质名 -> 贴图名，同一贴图的材质写在一起
+    result = {}
+    for mat, tex in textures.items():
+        result.setdefault(tex, []).append(mat)
+
+    for tex, mats in result.items():
+        for mat in mats:
+            yield f'$PreRenameMaterial "{mat}" "{tex}"\n'
+        yield "\n"
+
+
+def iter_bodygroup_qc(names):
+    for name in names:
+        yield f'$BodyGroup "{name}" {{\n\tstudio $custom_model$ InNode "{name}"\n\tblank\n}}\n'
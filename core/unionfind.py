@@ -0,0 +1,51 @@
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        root = x
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[x] != root:
+            self.parent[x], x = root, self.parent[x]
+        return root
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def cluster_merge_pairs(pairs, in_group: list[bool], heads=None) -> list[tuple[int, int]]:
+    # 把重合的骨骼聚成簇，不在集合里的骨骼合并到同簇里离它最近的集合内骨骼，优先选和它直接配对的
+    # 两个都在集合里的骨骼本来就不会合并，不用它们连接簇；没有 heads 时选下标最小的
+    clusters = UnionFind(len(in_group))
+    paired = {}
+    for a, b in pairs:
+        if in_group[a] and in_group[b]:
+            continue
+        clusters.union(a, b)
+        if in_group[a]:
+            paired.setdefault(b, []).append(a)
+        elif in_group[b]:
+            paired.setdefault(a, []).append(b)
+
+    members = {}
+    for i, grouped in enumerate(in_group):
+        if grouped:
+            members.setdefault(clusters.find(i), []).append(i)
+
+    merging = []
+    for i, grouped in enumerate(in_group):
+        if not grouped:
+            targets = paired.get(i) or members.get(clusters.find(i))
+            if targets:
+                merging.append((i, nearest_bone(heads, i, targets)))
+    return merging
+
+
+def nearest_bone(heads, i: int, targets: list[int]) -> int:
+    if heads is None:
+        return min(targets)
+    head = heads[i]
+    return min(targets, key=lambda j: (sum((float(a) - float(b)) ** 2 for a, b in zip(head, heads[j])), j))
@@ -0,0 +1,150 @@
+import numpy as np
+
+
+def resolve_merge_mapping(mapping: dict[str, str]) -> dict[str, str]:
+    # 链式合并 (C->B, B->A) 直接解析到最终目标 (C->A)
+    resolved = {}
+    for vg_from, vg_to in mapping.items():
+        seen = {vg_from}
+        while vg_to in mapping and vg_to not in seen:
+            seen.add(vg_to)
+            vg_to = mapping[vg_to]
+        if vg_to != vg_from:
+            resolved[vg_from] = vg_to
+    return resolved
+
+
+def merge_weight_arrays(verts, groups, weights, remap):
+    # remap[组] = 目标组，-1 表示不合并；结果相当于 VERTEX_WEIGHT_MIX 的 ADD 并限制到 1.0
+    # 只返回需要写回目标组的 (顶点, 组, 权重)
+    num_groups = len(remap)
+    is_src = remap[groups] >= 0
+    target = np.where(is_src, remap[groups], groups)
+
+    affected = np.zeros(num_groups, dtype=bool)
+    affected[remap[remap >= 0]] = True
+    rows = affected[target]
+
+    keys = verts[rows].astype(np.int64) * num_groups + target[rows]
+    keys, inverse = np.unique(keys, return_inverse=True)
+    total = np.bincount(inverse, weights=weights[rows], minlength=len(keys))
+    touched = np.bincount(inverse, weights=is_src[rows], minlength=len(keys)) > 0
+
+    keys = keys[touched]
+    return ((keys // num_groups).astype(np.int32),
+            (keys % num_groups).astype(np.int32),
+            np.minimum(total[touched], 1.0).astype(np.float32))
+
+
+def weight_runs(verts, groups, weights):
+    # 按 (组, 权重) 排序后切成段，每段可以用一次 vertex_group.add 写入
+    # 返回排序后的 (顶点, 组, 权重) 和每段的起止位置
+    order = np.lexsort((weights, groups))
+    verts, groups, weights = verts[order], groups[order], weights[order]
+    breaks = np.flatnonzero((groups[1:] != groups[:-1]) | (weights[1:] != weights[:-1])) + 1
+    if not len(verts):
+        return (verts, groups, weights), breaks, breaks
+    starts = np.concatenate(([0], breaks))
+    ends = np.append(starts[1:], len(verts))
+    return (verts, groups, weights), starts, ends
+
+
+def group_max_weights(groups, weights, group_count: int) -> np.ndarray:
+    max_weights = np.zeros(group_count, dtype=np.float32)
+    np.maximum.at(max_weights, groups, weights)
+    return max_weights
+
+
+def bone_aligned_group_remap(bone_indices: np.ndarray, bone_count: int, pad: bool = False) -> np.ndarray:
+    # 旧顶点组下标 -> 新下标：对应骨骼的顶点组按骨骼顺序排列，其他顶点组（-1）保持原顺序排在它们之后
+    # pad 时骨骼的顶点组放到骨骼下标处，中间空出的位置留给补上的空组
+    order_key = np.asarray(bone_indices, dtype=np.int64).copy()
+    others = np.flatnonzero(order_key < 0)
+    order_key[others] = bone_count + np.arange(len(others))
+    if pad:
+        return order_key
+    old_to_new = np.empty_like(order_key)
+    old_to_new[np.argsort(order_key, kind="stable")] = np.arange(len(order_key))
+    return old_to_new
+
+
+def mirror_weight_rows(verts, groups, weights, mirror_vertex: np.ndarray, mirror_group: np.ndarray):
+    # mirror_group[源组] = 对侧组，其它为 -1；有镜像顶点的顶点上，对侧组原有的权重由源组镜像后的权重替换
+    # mirror_vertex[顶点] = 镜像顶点，找不到为 -1；找不到镜像的顶点保留对侧组原有的权重
+    targets = np.zeros(len(mirror_group), dtype=bool)
+    targets[mirror_group[mirror_group >= 0]] = True
+    kept = ~(targets[groups] & (mirror_vertex[verts] >= 0))
+
+    source = (mirror_group[groups] >= 0) & (mirror_vertex[verts] >= 0)
+    return (np.concatenate([verts[kept], mirror_vertex[verts[source]]]).astype(np.int32),
+            np.concatenate([groups[kept], mirror_group[groups[source]]]).astype(np.int32),
+            np.concatenate([weights[kept], weights[source]]).astype(np.float32))
+
+
+def limit_influences(verts, weights, max_influences: int, locked=None) -> np.ndarray:
+    # 每个顶点只保留权重最大的 max_influences 个，返回保留的行
+    # locked 的行总是保留并排在最前面，也占名额
+    if locked is not None:
+        weights = np.where(locked, np.inf, weights)
+    order = np.lexsort((-weights, verts))
+    sorted_verts = verts[order]
+    first = np.searchsorted(sorted_verts, sorted_verts, side="left")
+    keep = np.zeros(len(verts), dtype=bool)
+    keep[order] = np.arange(len(order)) - first < max_influences
+    if locked is not None:
+        keep |= locked
+    return keep
+
+
+def normalize_weights(verts, weights, vertex_count: int, locked=None) -> np.ndarray:
+    # 每个顶点的权重和归一化到 1，权重和为 0 的顶点不变
+    # locked 的行不变，其余行归一化到 1 减去锁定权重之和，和 Normalize All 一样
+    if locked is None:
+        locked = np.zeros(len(weights), dtype=bool)
+    locked_totals = np.bincount(verts, weights=np.where(locked, weights, 0.0), minlength=vertex_count)
+    totals = np.bincount(verts, weights=np.where(locked, 0.0, weights), minlength=vertex_count)
+    targets = np.maximum(1.0 - locked_totals, 0.0)
+    scale = np.divide(targets, totals, out=np.ones_like(totals), where=totals > 0.0)
+    return np.where(locked, weights, weights * scale[verts]).astype(np.float32)
+
+
+def influence_histogram(verts, vertex_count: int) -> np.ndarray:
+    # 第 k 项为受 k 个顶点组影响的顶点数
+    return np.bincount(np.bincount(verts, minlength=vertex_count))
+
+
+def clean_weight_rows(verts, groups, weights, vertex_count: int, max_influences: int = 4,
+                      epsilon: float = 0.0, normalize: bool = True, locked_groups=None):
+    # 先删掉不超过 epsilon 的权重，再限制影响数量，最后归一化
+    # locked_groups[组] 为 True 的组不删也不改，只占影响数量和权重
+    if locked_groups is None:
+        locked_groups = np.zeros(int(groups.max(initial=-1)) + 1, dtype=bool)
+    locked = locked_groups[groups]
+    keep = (weights > epsilon) | locked
+    verts, groups, weights, locked = verts[keep], groups[keep], weights[keep], locked[keep]
+    if max_influences > 0:
+        keep = limit_influences(verts, weights, max_influences, locked)
+        verts, groups, weights, locked = verts[keep], groups[keep], weights[keep], locked[keep]
+    if normalize:
+        weights = normalize_weights(verts, weights, vertex_count, locked)
+        # 锁定的权重之和达到 1 时，其余的权重归一化成了 0
+        keep = (weights > 0.0) | locked
+        verts, groups, weights = verts[keep], groups[keep], weights[keep]
+    return verts, groups, weights
+
+
+def diff_weight_rows(old_rows, new_rows, group_count: int):
+    # 返回 (旧行里需要从顶点组删除的, 新行里需要写入的)：只有新增或权重变化的行才写
+    old_verts, old_groups, old_weights = old_rows
+    verts, groups, weights = new_rows
+    old_keys = old_verts.astype(np.int64) * group_count + old_groups
+    keys = verts.astype(np.int64) * group_count + groups
+    removed = ~np.isin(old_keys, keys)
+    if not len(old_keys):
+        return removed, np.ones(len(keys), dtype=bool)
+
+    order = np.argsort(old_keys)
+    position = np.minimum(np.searchsorted(old_keys[order], keys), len(order) - 1)
+    match = order[position]
+    changed = (old_keys[match] != keys) | (old_weights[match] != weights)
+    return removed, changed
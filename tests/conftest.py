@@ -0,0 +1,9 @@
+# core 不依赖 bpy，但插件目录本身是一个包，它的 __init__.py 会导入 bpy，所以不能 from <插件>.core import ...
+# 测试把插件目录加进 sys.path，把 core 当作顶层包导入。tests/pytest.ini 让 rootdir 停在 tests，
+# pytest 不会去导入插件的 __init__.py：
+#   python -m pytest tests
+# 在 blender 外使用 core 时同理：sys.path 里加入插件目录后 import core
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
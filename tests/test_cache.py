@@ -0,0 +1,30 @@
+import numpy as np
+
+from core.cache import LRUCache
+
+
+def test_lru_eviction_by_size():
+    cache = LRUCache(budget=2500)
+    for key in "abc":
+        cache.put(key, np.zeros(100))
+    cache.get("a")
+    cache.put("d", np.zeros(100))
+    assert cache.keys() == ["c", "a", "d"]
+    assert cache.size == 2400
+
+
+def test_oversized_value_is_not_cached():
+    cache = LRUCache(budget=100)
+    value = np.zeros(100)
+    assert cache.put("big", value) is value
+    assert "big" not in cache and cache.size == 0
+
+
+def test_pop_and_hits():
+    cache = LRUCache(budget=10000)
+    cache.put("a", np.zeros(10))
+    assert cache.get("missing") is None
+    assert cache.get("a") is not None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.pop("a")
+    assert len(cache) == 0 and cache.size == 0
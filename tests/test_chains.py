@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from core.chains import BoneChainIndex, bone_name_prefix
+
+
+def test_bone_name_prefix():
+    assert bone_name_prefix("Hair_01") == "Hair_"
+    assert bone_name_prefix("Skirt.L.001") == "Skirt."
+    assert bone_name_prefix("Head") == ""
+    # 与 BLI_string_split_prefix 一样从第二个字符开始找
+    assert bone_name_prefix("_Foo") == ""
+    assert bone_name_prefix(".Foo_Bar") == ".Foo_"
+
+
+def build():
+    #        Root(0)
+    #       /       \
+    #    A0(1)      B0(4)
+    #     |           |
+    #    A1(2)      B1(5)
+    #     |
+    #    A2(3)
+    names = ["Root", "A0", "A1", "A2", "B0", "B1"]
+    return BoneChainIndex(names, [-1, 0, 1, 2, 0, 4])
+
+
+def test_children_and_depth():
+    index = build()
+    assert index.children(0).tolist() == [1, 4]
+    assert index.children(3).tolist() == []
+    assert index.child_count.tolist() == [2, 1, 1, 0, 1, 0]
+    assert index.depth.tolist() == [0, 1, 2, 3, 1, 2]
+    assert index.root.tolist() == [0] * 6
+
+
+def test_chains_follow_first_child():
+    index = build()
+    assert [chain.tolist() for chain in index.chains] == [[0, 1, 2, 3], [4, 5]]
+    assert index.chain_from(1).tolist() == [1, 2, 3]
+    assert index.descend(4, 1) == 5
+    assert index.descend(4, 2) == -1
+
+
+def test_with_prefix():
+    index = BoneChainIndex(["Hair_0", "Hair_1", "Body"], [-1, 0, -1])
+    assert index.with_prefix("Hair_").tolist() == [0, 1]
+    assert index.with_prefix("Skirt_").tolist() == []
+
+
+def test_from_bones():
+    root = SimpleNamespace(name="Root", parent=None)
+    child = SimpleNamespace(name="Child", parent=root)
+    index = BoneChainIndex.from_bones([child, root])
+    assert index.names == ["Child", "Root"]
+    assert np.array_equal(index.parent, [1, -1])
@@ -0,0 +1,51 @@
+import numpy as np
+
+from core import decimate
+
+
+def test_every_other_keeps_root():
+    assert decimate.decimate_every_other(7, 1).tolist() == [0, 2, 4, 6]
+    assert decimate.decimate_every_other(7, 2).tolist() == [0, 4]
+    assert decimate.decimate_every_other(5, 0).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_unsubdivide_keeps_both_ends():
+    assert decimate.decimate_unsubdivide(6, 1).tolist() == [0, 2, 4, 5]
+    assert decimate.decimate_unsubdivide(5, 1).tolist() == [0, 2, 4]
+    assert decimate.decimate_unsubdivide(2, 3).tolist() == [0, 1]
+
+
+def test_rdp_importance_prefers_corners():
+    # 直线上加一个拐角，拐角最重要，直线上的点偏离为 0
+    points = np.array([[0, 0, 0], [1, 0, 0], [2, 0, 0], [2, 1, 0], [2, 2, 0]], dtype=np.float64)
+    importance = decimate.rdp_importance(points)
+    assert np.isinf(importance[[0, -1]]).all()
+    assert importance[2] == importance.max(where=np.isfinite(importance), initial=0.0) > 0.0
+    assert importance[1] == importance[3] == 0.0
+
+
+def test_curvature_importance():
+    points = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0]], dtype=np.float64)
+    importance = decimate.curvature_importance(points)
+    assert np.isinf(importance[[0, -1]]).all()
+    assert np.isclose(importance[1], np.pi / 2)
+
+
+def test_keep_most_important():
+    importance = np.array([np.inf, 0.1, 0.5, 0.2, np.inf])
+    assert decimate.keep_most_important(importance, 0.6).tolist() == [0, 2, 4]
+    # 至少保留两个点
+    assert decimate.keep_most_important(importance, 0.0).tolist() == [0, 4]
+
+
+def test_decimate_chain():
+    points = np.column_stack([np.arange(6.0), np.zeros(6), np.zeros(6)])
+    kept, heads = decimate.decimate_chain(points, "2", iterations=1)
+    assert kept.tolist() == [0, 2, 4] and heads is None
+
+    kept, heads = decimate.decimate_chain(points, "3", iterations=1)
+    assert kept.tolist() == [0, 1, 2, 3]
+    assert heads[:, 0].tolist() == [0.0, 2.0, 4.0, 5.0]
+
+    kept, heads = decimate.decimate_chain(points, "1", ratio=0.5)
+    assert kept[0] == 0 and kept[-1] == 5 and len(kept) == 3 and heads is None
@@ -0,0 +1,46 @@
+import json
+from pathlib import Path
+
+from core import name_map
+
+PRESETS = Path(__file__).resolve().parent.parent / "presets" / "bone_maps"
+
+
+def test_parse_bone_map_defaults():
+    preset = name_map.parse_bone_map({"rename": [["a", "b"]]}, "fallback")
+    assert preset["name"] == "fallback"
+    assert preset["rename"] == [("a", "b")]
+    assert preset["parent"] == []
+
+
+def test_load_bone_maps_later_directories_override(tmp_path):
+    first, second = tmp_path / "a", tmp_path / "b"
+    first.mkdir()
+    second.mkdir()
+    (first / "rig.json").write_text(json.dumps({"name": "First"}), encoding="utf-8")
+    (second / "rig.json").write_text(json.dumps({"name": "Second"}), encoding="utf-8")
+    (second / "broken.json").write_text("{", encoding="utf-8")
+
+    errors = []
+    presets = name_map.load_bone_maps([first, second], lambda path, error: errors.append(path.name))
+    assert presets["rig"]["name"] == "Second"
+    assert errors == ["broken.json"]
+
+
+def test_shipped_presets_load():
+    presets = name_map.load_bone_maps([PRESETS])
+    assert {"valve_biped", "v_mmd"} <= presets.keys()
+
+
+def test_plan_renames():
+    pairs = [("ValveBiped.Bip01_Head1", "V_Head1"), ("ValveBiped.Bip01_Neck1", "V_Neck1")]
+    names = ["ValveBiped.Bip01_Head1", "Extra"]
+    assert name_map.plan_renames(names, pairs) == ([("ValveBiped.Bip01_Head1", "V_Head1")], ["Extra"])
+    assert name_map.plan_renames(["V_Neck1"], pairs, reverse=True) == ([("V_Neck1", "ValveBiped.Bip01_Neck1")], [])
+
+
+def test_mirror_bone_name():
+    assert name_map.mirror_bone_name("ValveBiped.Bip01_L_Thigh") == "ValveBiped.Bip01_R_Thigh"
+    assert name_map.mirror_bone_name("V_Foot_R") == "V_Foot_L"
+    assert name_map.mirror_bone_name("V_Head1") == "V_Head1"
+    assert name_map.mirror_bone_name("Hair_LR") == "Hair_LR"
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from core import pairing
+
+
+def brute_force_pairs(points, threshold):
+    distances = np.linalg.norm(points[:, None, :] - points[None, :, :], axis=2)
+    a, b = np.nonzero(np.triu(distances <= threshold, k=1))
+    return sorted(zip(a.tolist(), b.tolist()))
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("threshold", [0.0, 0.05, 0.2])
+def test_find_pairs_matches_brute_force(seed, threshold):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(-1.0, 1.0, (300, 3))
+    # 一些完全重合和贴着阈值的点
+    points[:20] = points[20:40]
+    points[40:50] = points[50:60] + [threshold, 0.0, 0.0]
+    pairs = pairing.find_pairs_by_distance(points, threshold)
+    assert list(map(tuple, pairs.tolist())) == brute_force_pairs(points, threshold)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_find_pairs_in_chunks(chunk_size):
+    # 大部分点挤在同一个格子里，分块展开的结果和一次展开相同
+    rng = np.random.default_rng(3)
+    points = np.concatenate([rng.uniform(0.0, 0.01, (60, 3)), rng.uniform(-1.0, 1.0, (60, 3))])
+    pairs = pairing.find_pairs_by_distance(points, 0.05, chunk_size=chunk_size)
+    assert list(map(tuple, pairs.tolist())) == brute_force_pairs(points, 0.05)
+
+
+def test_find_pairs_small_inputs():
+    assert pairing.find_pairs_by_distance(np.zeros((0, 3)), 1.0).shape == (0, 2)
+    assert pairing.find_pairs_by_distance(np.zeros((1, 3)), 1.0).shape == (0, 2)
+    assert pairing.find_pairs_by_distance(np.zeros((2, 3)), 0.0).tolist() == [[0, 1]]
+
+
+def test_candidates_within_threshold():
+    rng = np.random.default_rng(7)
+    heads = rng.uniform(0.0, 1.0, (200, 3))
+    in_group = rng.random(200) < 0.5
+    names = [f"Bone{i}" for i in range(200)]
+    candidates = pairing.build_candidates(names, heads, in_group, 0.2)
+    for threshold in (0.0, 0.05, 0.1, 0.2):
+        expected = [(a, b) for a, b in brute_force_pairs(heads, threshold) if not (in_group[a] and in_group[b])]
+        assert pairing.pairs_within(candidates, threshold) == expected
+
+
+def test_merge_key_changes_with_inputs():
+    heads = np.zeros((2, 3))
+    key = pairing.merge_key(["A", "B"], heads, [True, False])
+    assert key == pairing.merge_key(["A", "B"], heads.copy(), [True, False])
+    assert key != pairing.merge_key(["A", "C"], heads, [True, False])
+    assert key != pairing.merge_key(["A", "B"], heads + 1.0, [True, False])
+    assert key != pairing.merge_key(["A", "B"], heads, [False, False])
+
+
+def test_find_mirror_vertices():
+    coords = np.array([[1.0, 0.0, 0.0], [-1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [2.0, 2.0, 2.0], [-1.00001, 0.0, 0.0]])
+    mirror = pairing.find_mirror_vertices(coords, 0.001)
+    assert mirror[0] == 1
+    assert mirror[1] == 0
+    assert mirror[2] == 2
+    assert mirror[3] == -1
+    assert mirror[4] == 0
@@ -0,0 +1,11 @@
+from core import qc
+
+
+def test_material_qc_groups_by_texture():
+    text = "".join(qc.iter_material_qc({"Skin": "body.png", "Cloth": "cloth.png", "Face": "body.png"}))
+    assert text == ('$PreRenameMaterial "Skin" "body.png"\n$PreRenameMaterial "Face" "body.png"\n\n'
+                    '$PreRenameMaterial "Cloth" "cloth.png"\n\n')
+
+
+def test_bodygroup_qc():
+    assert "".join(qc.iter_bodygroup_qc(["Hat"])) == '$BodyGroup "Hat" {\n\tstudio $custom_model$ InNode "Hat"\n\tblank\n}\n'
@@ -0,0 +1,47 @@
+from core.unionfind import UnionFind, cluster_merge_pairs
+
+
+def test_union_find():
+    clusters = UnionFind(5)
+    clusters.union(3, 4)
+    clusters.union(4, 1)
+    assert clusters.find(3) == clusters.find(1) == 1
+    assert clusters.find(0) == 0
+    assert clusters.find(2) == 2
+
+
+def test_cluster_targets_first_grouped_bone():
+    # 0, 1, 2 重合，1 和 2 在集合里；3 单独
+    in_group = [False, True, True, False]
+    assert cluster_merge_pairs([(0, 1), (0, 2), (1, 2)], in_group) == [(0, 1)]
+
+
+def test_cluster_chains_through_ungrouped_bones():
+    in_group = [False, False, True]
+    assert cluster_merge_pairs([(0, 1), (1, 2)], in_group) == [(0, 2), (1, 2)]
+
+
+def test_grouped_bones_do_not_connect_clusters():
+    # 1 和 2 都在集合里，它们重合不会把 0 和 3 连成一簇
+    in_group = [False, True, True, False]
+    assert cluster_merge_pairs([(0, 1), (1, 2), (2, 3)], in_group) == [(0, 1), (3, 2)]
+
+
+def test_cluster_without_target_is_not_merged():
+    assert cluster_merge_pairs([(0, 1)], [False, False]) == []
+
+
+def test_cluster_picks_nearest_grouped_bone():
+    # 0 - 1 - 2 - 3 连成一簇，1 和 3 在集合里；2 同时和 1、3 配对，3 离它更近
+    in_group = [False, True, False, True]
+    heads = [(0.0, 0.0, 0.0), (0.1, 0.0, 0.0), (0.3, 0.0, 0.0), (0.35, 0.0, 0.0)]
+    merged = cluster_merge_pairs([(0, 1), (1, 2), (2, 3)], in_group, heads)
+    assert merged == [(0, 1), (2, 3)]
+
+
+def test_cluster_prefers_directly_paired_bone():
+    # 0 只和 1 配对，虽然同簇的 3 离它更近
+    in_group = [False, True, False, True]
+    heads = [(0.0, 0.0, 0.0), (0.5, 0.0, 0.0), (0.6, 0.0, 0.0), (0.05, 0.0, 0.0)]
+    merged = cluster_merge_pairs([(0, 1), (1, 2), (2, 3)], in_group, heads)
+    assert merged == [(0, 1), (2, 1)]
@@ -0,0 +1,111 @@
+import numpy as np
+
+from core import weights
+
+
+def rows(*items):
+    verts, groups, values = zip(*items)
+    return np.array(verts, dtype=np.int32), np.array(groups, dtype=np.int32), np.array(values, dtype=np.float32)
+
+
+def as_dict(verts, groups, values):
+    return {(int(v), int(g)): round(float(w), 5) for v, g, w in zip(verts, groups, values)}
+
+
+def test_resolve_merge_mapping():
+    assert weights.resolve_merge_mapping({"C": "B", "B": "A"}) == {"C": "A", "B": "A"}
+    # 环不会死循环，映射回自己的被丢掉
+    assert weights.resolve_merge_mapping({"A": "B", "B": "A"}) == {}
+
+
+def test_merge_weight_arrays_adds_and_clamps():
+    # 组 1 合并到组 0
+    verts, groups, values = rows((0, 0, 0.5), (0, 1, 0.25), (1, 1, 0.75), (2, 0, 0.3), (3, 0, 0.8), (3, 1, 0.8))
+    remap = np.array([-1, 0], dtype=np.int32)
+    merged = weights.merge_weight_arrays(verts, groups, values, remap)
+    # 只有被合并组影响的顶点写回，顶点 2 不变
+    assert as_dict(*merged) == {(0, 0): 0.75, (1, 0): 0.75, (3, 0): 1.0}
+
+
+def test_weight_runs():
+    verts, groups, values = rows((0, 1, 0.5), (1, 0, 0.5), (2, 1, 0.5), (3, 1, 0.25))
+    (verts, groups, values), starts, ends = weights.weight_runs(verts, groups, values)
+    runs = [(int(groups[s]), float(values[s]), sorted(verts[s:e].tolist())) for s, e in zip(starts, ends)]
+    assert runs == [(0, 0.5, [1]), (1, 0.25, [3]), (1, 0.5, [0, 2])]
+
+    empty = np.zeros(0, dtype=np.int32)
+    _, starts, ends = weights.weight_runs(empty, empty, np.zeros(0, dtype=np.float32))
+    assert len(starts) == len(ends) == 0
+
+
+def test_group_max_weights():
+    _, groups, values = rows((0, 0, 0.2), (1, 0, 0.6), (1, 2, 0.1))
+    assert weights.group_max_weights(groups, values, 4).tolist() == np.float32([0.6, 0.0, 0.1, 0.0]).tolist()
+
+
+def test_bone_aligned_group_remap():
+    # 顶点组 0 不是骨骼，1 是骨骼 2，2 是骨骼 0，3 不是骨骼；共 3 根骨骼
+    remap = weights.bone_aligned_group_remap(np.array([-1, 2, 0, -1]), 3)
+    assert remap.tolist() == [2, 1, 0, 3]
+
+
+def test_bone_aligned_group_remap_pad():
+    # 骨骼 1 没有顶点组，补齐时它的位置空出来
+    remap = weights.bone_aligned_group_remap(np.array([-1, 2, 0, -1]), 3, pad=True)
+    assert remap.tolist() == [3, 2, 0, 4]
+
+
+def test_limit_influences_keeps_largest():
+    verts, groups, values = rows((0, 0, 0.1), (0, 1, 0.5), (0, 2, 0.3), (0, 3, 0.2), (1, 0, 1.0))
+    keep = weights.limit_influences(verts, values, 2)
+    assert keep.tolist() == [False, True, True, False, True]
+
+
+def test_normalize_weights():
+    verts, _, values = rows((0, 0, 0.5), (0, 1, 1.5), (1, 0, 0.0), (2, 0, 0.25))
+    assert weights.normalize_weights(verts, values, 3).tolist() == [0.25, 0.75, 0.0, 1.0]
+
+
+def test_influence_histogram():
+    verts, _, _ = rows((0, 0, 1.0), (0, 1, 1.0), (2, 0, 1.0))
+    assert weights.influence_histogram(verts, 4).tolist() == [2, 1, 1]
+
+
+def test_clean_weight_rows_prunes_then_limits_then_normalizes():
+    verts, groups, values = rows((0, 0, 0.6), (0, 1, 0.3), (0, 2, 0.2), (0, 3, 0.005), (1, 0, 0.5))
+    cleaned = weights.clean_weight_rows(verts, groups, values, 2, max_influences=2, epsilon=0.01)
+    assert as_dict(*cleaned) == {(0, 0): round(0.6 / 0.9, 5), (0, 1): round(0.3 / 0.9, 5), (1, 0): 1.0}
+
+
+def test_mirror_weight_rows_replaces_target_group():
+    # 组 0 (L) -> 组 1 (R)，顶点 0 和 1 互为镜像，顶点 2 在中线上，顶点 3 没有镜像
+    verts, groups, values = rows((0, 0, 0.5), (2, 0, 0.4), (3, 0, 0.9), (1, 1, 0.1), (0, 1, 0.7), (1, 2, 1.0))
+    mirror_vertex = np.array([1, 0, 2, -1])
+    mirror_group = np.array([1, -1, -1], dtype=np.int32)
+    mirrored = weights.mirror_weight_rows(verts, groups, values, mirror_vertex, mirror_group)
+    assert as_dict(*mirrored) == {(0, 0): 0.5, (2, 0): 0.4, (3, 0): 0.9, (1, 2): 1.0, (1, 1): 0.5, (2, 1): 0.4}
+
+
+def test_mirror_weight_rows_keeps_unmatched_target_rows():
+    # 顶点 1 没有镜像，它在对侧组 1 上的权重保留；顶点 0 的对侧权重被顶点 2 镜像过来的替换
+    verts, groups, values = rows((2, 0, 0.8), (0, 1, 0.3), (1, 1, 0.6))
+    mirror_vertex = np.array([2, -1, 0])
+    mirror_group = np.array([1, -1], dtype=np.int32)
+    mirrored = weights.mirror_weight_rows(verts, groups, values, mirror_vertex, mirror_group)
+    assert as_dict(*mirrored) == {(2, 0): 0.8, (1, 1): 0.6, (0, 1): 0.8}
+
+
+def test_clean_weight_rows_skips_locked_groups():
+    # 组 1 锁定：不被 epsilon 删掉、不被数量限制挤掉，其余权重归一化到 1 减去锁定的权重
+    verts, groups, values = rows((0, 0, 0.6), (0, 1, 0.005), (0, 2, 0.2), (1, 1, 0.7), (1, 0, 0.1), (2, 1, 1.0), (2, 2, 0.5))
+    locked = np.array([False, True, False])
+    cleaned = weights.clean_weight_rows(verts, groups, values, 3, max_influences=2, epsilon=0.01, locked_groups=locked)
+    assert as_dict(*cleaned) == {(0, 0): 0.995, (0, 1): 0.005, (1, 1): 0.7, (1, 0): 0.3, (2, 1): 1.0}
+
+
+def test_diff_weight_rows():
+    old = rows((0, 0, 0.5), (0, 1, 0.5), (1, 0, 1.0))
+    new = rows((0, 0, 1.0), (1, 0, 1.0), (2, 1, 0.3))
+    removed, changed = weights.diff_weight_rows(old, new, 2)
+    assert removed.tolist() == [False, True, False]
+    assert changed.tolist() == [True, False, True]